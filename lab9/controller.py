@@ -0,0 +1,99 @@
+import math
+import sys
+import time
+from islands import run_islands, TOPOLOGIES
+from population import XOVERS, NUM_GEN
+
+# Run controller of the island GA: a callback of run_islands that stops the run on the first rule met and streams
+# the progress. The rules are checked after every round of report_every generations: a target fitness, a stagnation
+# window (generations without improvement of the best fitness), a budget of fitness calls and one of wall-clock
+# seconds. The two budgets are checked before the next round, with the cost of the last one, so a run does not
+# overshoot them by a whole round. The cost of the first round also has the evaluation of the initial population
+# (and the start of the processes), so until a second round gives a per-round cost only the spent budget is checked.
+
+
+class RunController:
+    def __init__(self, target: float = 1.0, stagnation: int = None, max_calls: int = None, time_budget: float = None,
+                 stream=sys.stdout):
+        self.target = target
+        self.stagnation = stagnation  # generations without improvement before stopping
+        self.max_calls = max_calls
+        self.time_budget = time_budget  # seconds
+        self.stream = stream  # where the progress lines are written, None for no output
+        self.reset()
+
+    def reset(self) -> None:
+        # state of a new run, the clock starts now: called by controlled_run when the run starts
+        self.start = time.perf_counter()
+        self.history = []  # one record per round: generation, best, diversity, calls, elapsed
+        self.reason = None  # rule that stopped the run, None if it ran all its generations
+        self.best = -math.inf
+        self.improved = 0  # generation of the last improvement of the best fitness
+
+    def __call__(self, reports: list[dict]) -> bool:
+        # record of the round, then the rules in order: returns True to stop the run
+        record = {
+            'generation': max(report['generation'] for report in reports),
+            'best': max(report['best'] for report in reports),
+            'diversity': sum(report['diversity'] for report in reports) / len(reports),
+            'calls': sum(report['calls'] for report in reports),
+            'elapsed': time.perf_counter() - self.start,
+        }
+        # cost of the last round, none for the first one
+        previous = self.history[-1] if self.history else record
+        self.history.append(record)
+        if record['best'] > self.best:
+            self.best = record['best']
+            self.improved = record['generation']
+        if self.stream is not None:
+            print(f"generation {record['generation']:5d}  best {record['best']:.4f}  "
+                  f"diversity {record['diversity']:.3f}  calls {record['calls']:,}  {record['elapsed']:.1f}s",
+                  file=self.stream, flush=True)
+        if record['best'] >= self.target or math.isclose(record['best'], self.target):
+            self.reason = 'target'
+        elif self.stagnation is not None and record['generation'] - self.improved >= self.stagnation:
+            self.reason = 'stagnation'
+        elif self.max_calls is not None and 2 * record['calls'] - previous['calls'] > self.max_calls:
+            self.reason = 'max_calls'
+        elif self.time_budget is not None and 2 * record['elapsed'] - previous['elapsed'] > self.time_budget:
+            self.reason = 'time_budget'
+        return self.reason is not None
+
+
+def controlled_run(problem_type: int, controller: RunController, seed: int = 0, report_every: int = 5,
+                   **options) -> dict:
+    '''run_islands (with its options) under the controller: the result also has the reason of the stop'''
+    controller.reset()
+    result = run_islands(problem_type, seed, report_every=report_every, callback=controller, **options)
+    if controller.reason is None and math.isclose(1, result['fitness']):
+        controller.reason = 'target'
+    result['reason'] = controller.reason or 'generations'
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Island GA of lab9 with stopping rules')
+    parser.add_argument('problems', type=int, nargs='*', default=[1, 2, 5, 10])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', type=float, default=1.0)
+    parser.add_argument('--stagnation', type=int, default=None, help='generations without improvement')
+    parser.add_argument('--max-calls', type=int, default=None)
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds per problem')
+    parser.add_argument('--generations', type=int, default=NUM_GEN)
+    parser.add_argument('--report-every', type=int, default=5, help='generations between two checks of the rules')
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='ring')
+    parser.add_argument('--xover', choices=sorted(XOVERS), default='uniform')
+    parser.add_argument('--serial', action='store_true', help='run the islands in this process')
+    parser.add_argument('--cache-size', type=int, default=None, help='genomes in the fitness cache of every island')
+    parser.add_argument('--quiet', action='store_true', help='no progress lines')
+    args = parser.parse_args()
+
+    for problem_type in args.problems:
+        controller = RunController(args.target, args.stagnation, args.max_calls, args.time_budget,
+                                   None if args.quiet else sys.stdout)
+        result = controlled_run(problem_type, controller, args.seed, args.report_every, generations=args.generations,
+                                topology=args.topology, xover=args.xover, processes=not args.serial,
+                                cache_size=args.cache_size)
+        print(f"Problem {problem_type}\nFitness: {result['fitness']}\nSolved with {result['calls']:,} fitness calls "
+              f"({result['generations']} generations, stopped by {result['reason']})")
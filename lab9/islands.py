@@ -0,0 +1,174 @@
+import math
+from multiprocessing import Pipe, Process
+import numpy as np
+import lab9_lib
+from population import Population, XOVERS, unpack, NUM_GEN, NUM_ISLANDS, NUM_POPULATION, NUM_MIGRANTS, MIGRATION_STEP
+
+# Island model with one process per island. The coordinator drives the islands in rounds: every island evolves
+# `report_every` generations on its own and reports, and at the end of every MIGRATION_STEP generations the islands
+# send their best NUM_MIGRANTS individuals, which the coordinator routes on the topology ('ring': island i receives
+# from island i - 1, 'random_pairs': random pairs of islands swap them). Every island has its own random generator,
+# spawned from the seed, and the coordinator waits for all of them in order at every exchange, so a run only depends
+# on the seed, not on how the processes are scheduled. With processes=False the same islands run in this process.
+
+TOPOLOGIES = ('ring', 'random_pairs')
+
+
+class Island:
+    # one island: its population, problem (its calls are the calls of the island) and random generator.
+    # handle() answers the commands of the coordinator, which arrive through a pipe when it runs in a worker
+    def __init__(self, problem_type: int, size: int, xover: str, seed_sequence: np.random.SeedSequence,
+                 cache_size: int = None):
+        self.rng = np.random.default_rng(seed_sequence)
+        self.problem = lab9_lib.make_problem(problem_type, cache_size=cache_size)
+        self.xover = XOVERS[xover]
+        self.population = Population.random(self.problem, self.rng, islands=1, size=size)
+        self.generation = 0
+
+    def solved(self) -> bool:
+        return math.isclose(1, self.population.fitness[0, 0])
+
+    def report(self) -> dict:
+        return {'best': float(self.population.fitness[0, 0]), 'calls': self.problem.calls,
+                'generation': self.generation, 'diversity': self.population.diversity()[0]}
+
+    def handle(self, command: tuple):
+        name = command[0]
+        if name == 'evolve':  # ('evolve', generations) -> report, stops early once solved
+            for _ in range(command[1]):
+                if self.solved():
+                    break
+                self.population.step(self.problem, self.rng, self.xover)
+                self.generation += 1
+            return self.report()
+        if name == 'emigrants':  # ('emigrants', k) -> (genomes, fitness) of the best k
+            return self.population.genomes[0, :command[1]].copy(), self.population.fitness[0, :command[1]].copy()
+        if name == 'immigrants':  # ('immigrants', genomes, fitness): they replace the best individuals
+            genomes, fitness = command[1], command[2]
+            self.population.genomes[0, :len(genomes)] = genomes
+            self.population.fitness[0, :len(fitness)] = fitness
+            self.population.sort()
+            return None
+        if name == 'result':  # ('result',) -> (packed best genome, fitness, calls)
+            return self.population.genomes[0, 0].copy(), float(self.population.fitness[0, 0]), self.problem.calls
+        raise ValueError(f'unknown command {name!r}')
+
+
+def _worker(connection, *args) -> None:
+    # process of an island: answers the commands until the result has been sent
+    island = Island(*args)
+    while True:
+        command = connection.recv()
+        reply = island.handle(command)
+        if reply is not None:
+            connection.send(reply)
+        if command[0] == 'result':
+            break
+    connection.close()
+
+
+class _Remote:
+    # island in a worker process, with the interface of Island.handle
+    def __init__(self, *args):
+        self.connection, other = Pipe()
+        self.process = Process(target=_worker, args=(other, *args), daemon=True)
+        self.process.start()
+
+    def send(self, command: tuple) -> None:
+        self.connection.send(command)
+
+    def receive(self):
+        return self.connection.recv()
+
+
+class _Local:
+    # island in this process: the reply of a command is kept until it is received
+    def __init__(self, *args):
+        self.island = Island(*args)
+        self.reply = None
+
+    def send(self, command: tuple) -> None:
+        self.reply = self.island.handle(command)
+
+    def receive(self):
+        return self.reply
+
+
+def routes(topology: str, islands: int, rng: np.random.Generator) -> list[int]:
+    # source island of the immigrants of every island, -1 for an island without immigrants
+    if topology == 'ring':
+        return [(idx - 1) % islands for idx in range(islands)]
+    if topology == 'random_pairs':
+        sources = [-1] * islands
+        order = rng.permutation(islands)
+        for first, second in zip(order[0::2], order[1::2]):
+            sources[first], sources[second] = int(second), int(first)
+        return sources
+    raise ValueError(f'unknown topology {topology!r}, use one of {TOPOLOGIES}')
+
+
+def run_islands(problem_type: int, seed: int = 0, islands: int = NUM_ISLANDS, topology: str = 'ring',
+                generations: int = NUM_GEN, xover: str = 'uniform', size: int = NUM_POPULATION,
+                migrants: int = NUM_MIGRANTS, migration_step: int = MIGRATION_STEP, report_every: int = None,
+                processes: bool = True, callback: callable = None, cache_size: int = None) -> dict:
+    '''
+    Runs the island GA until `generations` generations or an island reaches fitness 1. After every round the
+    reports of the islands (list of dicts with best, calls, generation and diversity) are given to callback, which
+    can stop the run by returning True. With cache_size every island has a fitness cache of that many genomes.
+    Returns the best genome (unpacked), its fitness, the total fitness calls and the generations run
+    '''
+    report_every = report_every or migration_step
+    sequences = np.random.SeedSequence(seed).spawn(islands + 1)
+    routing_rng = np.random.default_rng(sequences[-1])
+    kind = _Remote if processes else _Local
+    nodes = [kind(problem_type, size, xover, sequences[idx], cache_size) for idx in range(islands)]
+    generation = 0
+    try:
+        while generation < generations:
+            step = min(report_every, generations - generation, migration_step - generation % migration_step)
+            for node in nodes:
+                node.send(('evolve', step))
+            reports = [node.receive() for node in nodes]
+            generation += step
+            if callback is not None and callback(reports):
+                break
+            if any(math.isclose(1, report['best']) for report in reports):
+                break
+            if generation % migration_step == 0 and generation < generations:
+                for node in nodes:
+                    node.send(('emigrants', migrants))
+                emigrants = [node.receive() for node in nodes]
+                for node, source in zip(nodes, routes(topology, islands, routing_rng)):
+                    if source >= 0:
+                        node.send(('immigrants', *emigrants[source]))
+        for node in nodes:
+            node.send(('result',))
+        results = [node.receive() for node in nodes]
+    finally:
+        for node in nodes:
+            if isinstance(node, _Remote):
+                node.process.join(timeout=1)
+                if node.process.is_alive():
+                    node.process.terminate()
+    genome, fitness, _ = max(results, key=lambda result: result[1])
+    return {'genome': unpack(genome), 'fitness': fitness, 'calls': sum(result[2] for result in results),
+            'generations': generation}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Island GA of lab9 with one process per island')
+    parser.add_argument('problems', type=int, nargs='*', default=[1, 2, 5, 10])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--islands', type=int, default=NUM_ISLANDS)
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='ring')
+    parser.add_argument('--generations', type=int, default=NUM_GEN)
+    parser.add_argument('--xover', choices=sorted(XOVERS), default='uniform')
+    parser.add_argument('--serial', action='store_true', help='run the islands in this process')
+    parser.add_argument('--cache-size', type=int, default=None, help='genomes in the fitness cache of every island')
+    args = parser.parse_args()
+
+    for problem_type in args.problems:
+        result = run_islands(problem_type, args.seed, args.islands, args.topology, args.generations, args.xover,
+                             processes=not args.serial, cache_size=args.cache_size)
+        print(f"Problem {problem_type}\nFitness: {result['fitness']}\nSolved with {result['calls']:,} fitness calls")
@@ -3,6 +3,8 @@
 # Free for personal or classroom use; see 'LICENSE.md' for details.
 
 from abc import abstractmethod
+from collections import OrderedDict
+import numpy as np
 
 
 class AbstractProblem:
@@ -30,12 +32,116 @@ class AbstractProblem:
         )
         return val / len(genome) 
 
+    def batch(self, genomes, loci=None):
+        # fitness of every row of a (population x loci) matrix, equal to calling the problem on each row. With loci,
+        # the rows are bit-packed (np.packbits along the rows) and are unpacked first. Counts as len(genomes) calls
+        genomes = np.asarray(genomes)
+        if loci is not None:
+            genomes = np.unpackbits(genomes.astype(np.uint8), axis=1, count=loci)
+        n, length = genomes.shape
+        self._calls += n
+        # ones of every slice genome[s::x]: the genomes padded to a multiple of x, one column per slice
+        width = -(-length // self.x) * self.x
+        bits = np.zeros((n, width), dtype=np.int64)
+        bits[:, :length] = genomes != 0
+        fitnesses = -np.sort(-bits.reshape(n, width // self.x, self.x).sum(axis=1), axis=1)
+        best = fitnesses[:, 0]
+        ties = (fitnesses == best[:, None]).sum(axis=1)
+        # the penalties added one at a time, in the order of __call__, so the result is the same to the last bit
+        rows = np.arange(n)
+        penalty = np.zeros(n)
+        for k in range(self.x - 1):
+            position = ties + k
+            f = np.where(position < self.x, fitnesses[rows, np.minimum(position, self.x - 1)], 0)
+            penalty = penalty + f * (0.1 ** (k + 1))
+        return (best * ties - penalty) / length
 
-def make_problem(a): 
+
+class CachedProblem:
+    # memoizing wrapper of a problem: the fitness of the last `maxsize` genomes seen, keyed by the bit-packed genome,
+    # in LRU order. Only the misses reach the problem, so `calls` counts the real evaluations; hits, misses and
+    # evictions are counted apart
+    def __init__(self, problem, maxsize=100_000):
+        self.problem = problem
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def x(self):
+        return self.problem.x
+
+    @property
+    def calls(self):
+        return self.problem.calls
+
+    @staticmethod
+    def key(genome):
+        return np.packbits(np.asarray(genome) != 0).tobytes()
+
+    def _store(self, key, value):
+        self.cache[key] = value
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, key):
+        value = self.cache.get(key)
+        if value is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def __call__(self, genome):
+        key = CachedProblem.key(genome)
+        value = self._lookup(key)
+        if value is None:
+            self.misses += 1
+            value = self.problem(genome)
+            self._store(key, value)
+        return value
+
+    def batch(self, genomes, loci=None):
+        # as AbstractProblem.batch: the genomes not in the cache are evaluated in one batch, once each
+        if loci is None:
+            genomes = np.asarray(genomes)
+            packed, loci = np.packbits(genomes != 0, axis=1), genomes.shape[1]
+        else:
+            packed = np.asarray(genomes, dtype=np.uint8)
+        keys = [row.tobytes() for row in packed]
+        values = np.empty(len(keys))
+        missing = {}  # key -> rows of the batch waiting for it
+        for idx, key in enumerate(keys):
+            if key in missing:
+                missing[key].append(idx)
+                self.hits += 1
+                continue
+            value = self._lookup(key)
+            if value is None:
+                missing[key] = [idx]
+                self.misses += 1
+            else:
+                values[idx] = value
+        if missing:
+            rows = [idxs[0] for idxs in missing.values()]
+            for key, idxs, value in zip(missing, missing.values(), self.problem.batch(packed[rows], loci)):
+                values[idxs] = value
+                self._store(key, float(value))
+        return values
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.cache),
+                'calls': self.calls}
+
+
+def make_problem(a, cache_size=None): 
     class Problem(AbstractProblem):
         @property
         @abstractmethod
         def x(self):
             return a
 
-    return Problem()
+    # with cache_size, the problem is wrapped in a CachedProblem of that size
+    return Problem() if cache_size is None else CachedProblem(Problem(), cache_size)
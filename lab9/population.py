@@ -0,0 +1,177 @@
+import math
+import numpy as np
+import lab9_lib
+
+# Population engine of the island GA on bit-packed genomes. All the islands are kept in one uint8 array of shape
+# (islands, population, bytes), one bit per locus (np.packbits order, the first locus in the highest bit), so an
+# individual of 1000 loci takes 125 bytes instead of a list of 1000 ints. Selection, crossover and mutation work on
+# the whole batch of offspring of every island at once, and the offspring are evaluated with problem.batch.
+
+NUM_GEN = 1000
+TOURNAMENT_SIZE = 2
+MUTATION_PROBABILITY = .15
+NUM_ISLANDS = 8
+NUM_POPULATION = 200
+NUM_OFFSPRING = 300
+LOCI = 1000
+NUM_MIGRANTS = 25
+MIGRATION_STEP = 50
+
+
+def random_genomes(rng: np.random.Generator, shape: tuple, loci: int = LOCI) -> np.ndarray:
+    # packed random genomes of the given shape (e.g. (islands, population)), the padding bits are zero
+    return np.packbits(rng.integers(0, 2, (*shape, loci), dtype=np.uint8), axis=-1)
+
+
+def unpack(genomes: np.ndarray, loci: int = LOCI) -> np.ndarray:
+    # the genomes as 0/1 arrays, one locus per element
+    return np.unpackbits(genomes, axis=-1, count=loci)
+
+
+def _parity_masks(cuts: np.ndarray, loci: int) -> np.ndarray:
+    # packed masks with the bits before the first cut set, then alternating at every cut (cuts of a row distinct)
+    flips = np.zeros((len(cuts), loci + 1), dtype=np.int8)
+    np.add.at(flips, (np.arange(len(cuts))[:, None], cuts), 1)
+    return np.packbits(np.cumsum(flips[:, :loci], axis=1) % 2 == 0, axis=1)
+
+
+def _combine(parents1: np.ndarray, parents2: np.ndarray, masks: np.ndarray) -> np.ndarray:
+    # bits of parents1 where the mask is set, of parents2 elsewhere
+    return (parents1 & masks) | (parents2 & ~masks)
+
+
+def one_cut_xover(parents1: np.ndarray, parents2: np.ndarray, rng: np.random.Generator,
+                  loci: int = LOCI) -> np.ndarray:
+    # offspring with the loci of parents1 before a random cut point and of parents2 after it
+    return _combine(parents1, parents2, _parity_masks(rng.integers(0, loci, (len(parents1), 1)), loci))
+
+
+def n_cut_xover(parents1: np.ndarray, parents2: np.ndarray, rng: np.random.Generator, loci: int = LOCI,
+                n: int = 4) -> np.ndarray:
+    # offspring taking the loci alternately from the two parents between n distinct random cut points
+    cuts = rng.random((len(parents1), loci - 2)).argpartition(n, axis=1)[:, :n] + 1
+    return _combine(parents1, parents2, _parity_masks(cuts, loci))
+
+
+def uniform_xover(parents1: np.ndarray, parents2: np.ndarray, rng: np.random.Generator,
+                  loci: int = LOCI) -> np.ndarray:
+    # offspring taking every locus from one of the two parents with probability 1/2: the mask is random bytes
+    return _combine(parents1, parents2, rng.integers(0, 256, parents1.shape, dtype=np.uint8))
+
+
+XOVERS = {'one_cut': one_cut_xover, 'n_cut': n_cut_xover, 'uniform': uniform_xover}
+
+
+def mutate(genomes: np.ndarray, rng: np.random.Generator, loci: int = LOCI) -> np.ndarray:
+    # copies of the genomes with one random locus flipped each
+    mutated = genomes.copy()
+    rows = np.arange(len(genomes))
+    positions = rng.integers(0, loci, len(genomes))
+    mutated[rows, positions // 8] ^= (0x80 >> (positions % 8)).astype(np.uint8)
+    return mutated
+
+
+def tournament_selection(fitness: np.ndarray, n: int, rng: np.random.Generator,
+                         size: int = TOURNAMENT_SIZE) -> np.ndarray:
+    # (islands, n) indices of the champions of n tournaments per island among `size` random individuals
+    islands, population = fitness.shape
+    pools = rng.integers(0, population, (islands, n, size))
+    champions = fitness[np.arange(islands)[:, None, None], pools].argmax(axis=2)
+    return np.take_along_axis(pools, champions[:, :, None], axis=2)[:, :, 0]
+
+
+class Population:
+    # the islands of the GA: genomes (islands, population, bytes) and their fitness, every island sorted by fitness
+    def __init__(self, genomes: np.ndarray, fitness: np.ndarray, loci: int = LOCI):
+        self.genomes = genomes
+        self.fitness = fitness
+        self.loci = loci
+
+    @classmethod
+    def random(cls, problem, rng: np.random.Generator, islands: int = NUM_ISLANDS, size: int = NUM_POPULATION,
+               loci: int = LOCI) -> 'Population':
+        genomes = random_genomes(rng, (islands, size), loci)
+        population = cls(genomes, evaluate(problem, genomes, loci), loci)
+        population.sort()
+        return population
+
+    def sort(self) -> None:
+        # stable, so individuals of equal fitness keep their order
+        order = np.argsort(-self.fitness, axis=1, kind='stable')
+        self.genomes = np.take_along_axis(self.genomes, order[:, :, None], axis=1)
+        self.fitness = np.take_along_axis(self.fitness, order, axis=1)
+
+    def best(self) -> tuple[np.ndarray, float]:
+        # (unpacked genome, fitness) of the best individual of all the islands
+        island = int(self.fitness[:, 0].argmax())
+        return unpack(self.genomes[island, 0], self.loci), float(self.fitness[island, 0])
+
+    def offspring(self, rng: np.random.Generator, xover: callable = uniform_xover, size: int = NUM_OFFSPRING,
+                  islands: np.ndarray = None) -> np.ndarray:
+        '''
+        (len(islands), size, bytes) offspring of the given islands (all by default): with MUTATION_PROBABILITY
+        a mutated copy of a parent, otherwise a mutated crossover of two parents, both chosen by tournament
+        '''
+        islands = np.arange(len(self.genomes)) if islands is None else islands
+        genomes, fitness = self.genomes[islands], self.fitness[islands]
+        rows = np.arange(len(islands))[:, None]
+        parents1 = genomes[rows, tournament_selection(fitness, size, rng)].reshape(-1, genomes.shape[2])
+        parents2 = genomes[rows, tournament_selection(fitness, size, rng)].reshape(-1, genomes.shape[2])
+        only_mutation = rng.random(len(parents1)) < MUTATION_PROBABILITY
+        children = np.where(only_mutation[:, None], parents1, xover(parents1, parents2, rng, self.loci))
+        return mutate(children, rng, self.loci).reshape(len(islands), size, -1)
+
+    def step(self, problem, rng: np.random.Generator, xover: callable = uniform_xover,
+             size: int = NUM_OFFSPRING) -> None:
+        '''
+        One generation of the islands not solved yet: their offspring are evaluated in one batch and the best
+        individuals among the old ones and the offspring survive
+        '''
+        islands = np.flatnonzero(~np.isclose(self.fitness[:, 0], 1))
+        if not len(islands):
+            return
+        children = self.offspring(rng, xover, size, islands)
+        population = self.genomes.shape[1]
+        genomes = np.concatenate([self.genomes[islands], children], axis=1)
+        fitness = np.concatenate([self.fitness[islands], evaluate(problem, children, self.loci)], axis=1)
+        order = np.argsort(-fitness, axis=1, kind='stable')[:, :population]
+        self.genomes[islands] = np.take_along_axis(genomes, order[:, :, None], axis=1)
+        self.fitness[islands] = np.take_along_axis(fitness, order, axis=1)
+
+    def diversity(self) -> list[float]:
+        # mean Hamming distance between two individuals of every island, as a fraction of the loci
+        ones = unpack(self.genomes, self.loci).mean(axis=1)
+        size = self.genomes.shape[1]
+        return ((2 * ones * (1 - ones)).mean(axis=1) * size / max(1, size - 1)).tolist()
+
+    def migrate(self, rng: np.random.Generator, migrants: int = NUM_MIGRANTS) -> None:
+        # the islands are paired at random and every pair swaps its best `migrants` individuals
+        order = rng.permutation(len(self.genomes))
+        pairs = order[:len(order) // 2 * 2].reshape(-1, 2)
+        for array in (self.genomes, self.fitness):
+            first = array[pairs[:, 0], :migrants].copy()
+            array[pairs[:, 0], :migrants] = array[pairs[:, 1], :migrants]
+            array[pairs[:, 1], :migrants] = first
+        self.sort()
+
+
+def evaluate(problem, genomes: np.ndarray, loci: int = LOCI) -> np.ndarray:
+    # fitness of packed genomes of any leading shape, with one call of problem.batch
+    return problem.batch(genomes.reshape(-1, genomes.shape[-1]), loci).reshape(genomes.shape[:-1])
+
+
+def algorithm_island(problem_type: int, xover: callable = uniform_xover, seed: int = None,
+                     generations: int = NUM_GEN, cache_size: int = None) -> tuple[np.ndarray, float, int]:
+    ## Island model genetic algorithm of lab9.ipynb on the packed population, with a fitness cache of cache_size
+    ## genomes if given. Returns the best genome, its fitness and the fitness calls
+    rng = np.random.default_rng(seed)
+    fitness = lab9_lib.make_problem(problem_type, cache_size=cache_size)
+    population = Population.random(fitness, rng)
+    for generation in range(generations):
+        if math.isclose(1, population.fitness[:, 0].max()):
+            break
+        if (generation + 1) % MIGRATION_STEP == 0:
+            population.migrate(rng)
+        population.step(fitness, rng, xover)
+    genome, value = population.best()
+    return genome, value, fitness.calls
@@ -0,0 +1,125 @@
+import numpy as np
+import metrics
+from game import MOVES, MOVE_IDS, MOVE_CELLS, MOVE_LINE_CELLS, MOVE_PERMS, MOVE_TARGETS, LINE_CELLS
+
+# Vectorized playouts: N boards are kept in one (N, 25) int8 array and all of them advance by one
+# move per step. A move is a gather with a precomputed permutation of the 25 cells followed by the
+# write of the taken piece, the winner is read from the 12 lines with one fancy index.
+
+NUM_MOVES = len(MOVES)
+
+
+def _build_permutations() -> tuple[np.ndarray, np.ndarray]:
+    # the slide table of game.py on the whole flat board: for each move id the permutation of the 25 cells made by
+    # the slide and the cell where the taken piece goes
+    perms = np.tile(np.arange(25), (NUM_MOVES, 1))
+    targets = np.zeros(NUM_MOVES, dtype=np.int64)
+    for move_id, line in enumerate(MOVE_LINE_CELLS):
+        perms[move_id, line] = [line[i] for i in MOVE_PERMS[move_id]]
+        targets[move_id] = line[MOVE_TARGETS[move_id]]
+    return perms, targets
+
+
+PERMUTATIONS, TARGETS = _build_permutations()
+
+# the 12 lines as flat indexes, in the order Game.check_winner scans them
+LINES = LINE_CELLS
+
+
+def winners(boards: np.ndarray) -> np.ndarray:
+    '''Winner of each of the (N, 25) boards, -1 if there is none. Same rule of Game.check_winner: the first complete line wins'''
+    lines = boards[:, LINES]
+    complete = (lines[:, :, 0] >= 0) & (lines == lines[:, :, :1]).all(axis=2)
+    first = complete.argmax(axis=1)
+    result = lines[np.arange(len(boards)), first, 0].astype(np.int8)
+    result[~complete.any(axis=1)] = -1
+    return result
+
+
+def apply_moves(boards: np.ndarray, move_ids: np.ndarray, players: np.ndarray) -> np.ndarray:
+    '''Returns the (N, 25) boards after each player in `players` plays the corresponding move id'''
+    rows = np.arange(len(boards))
+    result = boards[rows[:, None], PERMUTATIONS[move_ids]]
+    result[rows, TARGETS[move_ids]] = players
+    return result
+
+
+def legal_mask(boards: np.ndarray, players: np.ndarray) -> np.ndarray:
+    '''(N, 44) mask of the legal moves, a move is legal if the taken piece is neutral or of the player'''
+    cells = boards[:, MOVE_CELLS]
+    return (cells < 0) | (cells == players[:, None])
+
+
+def _random_choice(mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # one uniformly random True column per row: random keys, the legal one with the highest key wins
+    keys = rng.random(mask.shape)
+    keys[~mask] = -1
+    return keys.argmax(axis=1)
+
+
+def _greedy_choice(boards: np.ndarray, players: np.ndarray, mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # like experimental_available_moves: a winning move if there is one, otherwise a random move
+    # among the ones that do not make the opponent win, otherwise any legal move
+    n = len(boards)
+    children = boards[:, PERMUTATIONS]
+    children[:, np.arange(NUM_MOVES), TARGETS] = players[:, None]
+    outcome = winners(children.reshape(n * NUM_MOVES, 25)).reshape(n, NUM_MOVES)
+    winning = mask & (outcome == players[:, None])
+    safe = mask & (outcome != 1 - players[:, None])
+    keys = rng.random(mask.shape)
+    keys = np.where(winning, keys + 4, np.where(safe, keys + 2, np.where(mask, keys, -1)))
+    return keys.argmax(axis=1)
+
+
+def play_out(boards: np.ndarray, players: np.ndarray, rng: np.random.Generator = None,
+             policy: str = 'random', max_moves: int = 200) -> np.ndarray:
+    '''
+    Plays all the (N, 25) boards until the end, `players` are the players to move in each of them.
+    policy is 'random' (uniform legal moves, as MonteCarloPlayer) or 'greedy' (win if possible, avoid
+    immediate losses, as ExperimentPlayer). Games still open after max_moves count as draws.
+    Returns the winner of each game, -1 for the draws.
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    boards = np.array(boards, dtype=np.int8).reshape(-1, 25)
+    metrics.count('rollout.playouts', len(boards))
+    players = np.broadcast_to(np.asarray(players, dtype=np.int8), (len(boards),)).copy()
+    result = winners(boards)
+    # indexes of the games still running: finished games are dropped from the arrays at every step
+    alive = np.flatnonzero(result < 0)
+    boards, players = boards[alive], players[alive]
+    for _ in range(max_moves):
+        if not len(alive):
+            break
+        mask = legal_mask(boards, players)
+        if policy == 'greedy':
+            move_ids = _greedy_choice(boards, players, mask, rng)
+        else:
+            move_ids = _random_choice(mask, rng)
+        boards = apply_moves(boards, move_ids, players)
+        players = 1 - players
+        winner = winners(boards)
+        done = winner >= 0
+        result[alive[done]] = winner[done]
+        alive, boards, players = alive[~done], boards[~done], players[~done]
+        metrics.count('rollout.moves', len(done))
+    return result
+
+
+def score_board(board: np.ndarray, player: int, move_id: int, num_playouts: int, rng: np.random.Generator = None,
+                policy: str = 'random', max_moves: int = 200) -> int:
+    '''
+    Scores the move `move_id` of `player` on a 5x5 board with num_playouts playouts in a single call:
+    +1 for every win of the player, -1 for every loss
+    '''
+    board = np.asarray(board, dtype=np.int8).reshape(1, 25)
+    board = apply_moves(board, np.array([move_id]), np.array([player], dtype=np.int8))
+    boards = np.repeat(board, num_playouts, axis=0)
+    result = play_out(boards, np.full(num_playouts, 1 - player, dtype=np.int8), rng, policy, max_moves)
+    return int(np.count_nonzero(result == player)) - int(np.count_nonzero(result == 1 - player))
+
+
+def score_move(game, move, num_playouts: int, rng: np.random.Generator = None, policy: str = 'random',
+               max_moves: int = 200) -> int:
+    '''Like score_board, for a candidate move (a (position, slide) tuple or a move id) of the current player of `game`'''
+    move_id = move if isinstance(move, (int, np.integer)) else MOVE_IDS[(tuple(move[0]), move[1])]
+    return score_board(game.get_board(), game.get_current_player(), move_id, num_playouts, rng, policy, max_moves)
@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import numpy as np
+import batch_rollout
+from bitboard_game import BitboardGame
+from tournament import PLAYERS, ENGINES
+
+# Reproducible benchmarks of the engines and the players. The positions are built by seeded random games, so every
+# run measures the same work: engine operations are reported in calls per second (best of `repeat` runs, and the
+# median), players in seconds per move. The results are written as JSON with the commit and the machine they were
+# measured on, and a previous file can be given to --compare to print the ratios.
+
+
+def positions(seed: int, count: int, min_moves: int = 4, max_moves: int = 30) -> list[list[int]]:
+    '''count move id sequences of random games, stopped between min_moves and max_moves before the end of the game'''
+    rng = random.Random(seed)
+    result = []
+    while len(result) < count:
+        game = BitboardGame()
+        player = 0
+        moves = []
+        for _ in range(rng.randint(min_moves, max_moves)):
+            move_id = rng.choice(list(game.iter_move_ids(player)))
+            game.push(move_id, player)
+            if game.check_winner() != -1:
+                break
+            moves.append(move_id)
+            player = 1 - player
+        else:
+            result.append(moves)
+    return result
+
+
+def setup(engine: str, moves: list[int]):
+    '''Game of the engine after the moves, player 0 first. Its current player is the one to move'''
+    game = ENGINES[engine]()
+    for idx, move_id in enumerate(moves):
+        game.push(move_id, idx % 2)
+    game.current_player_idx = len(moves) % 2
+    return game
+
+
+def _rates(function, items: list, repeat: int) -> dict:
+    # calls per second of function over all the items, best and median of the runs
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        times.append(time.perf_counter() - start)
+    return {'ops_per_sec': len(items) / min(times), 'median_ops_per_sec': len(items) / float(np.median(times)),
+            'calls': len(items), 'repeat': repeat}
+
+
+def _push_pop(game) -> None:
+    for move_id in game.iter_move_ids(game.current_player_idx):
+        game.push(move_id)
+        game.pop()
+
+
+def _random_playout(game) -> None:
+    # random moves until the end of the game, then all of them are undone
+    played = 0
+    while game.check_winner() == -1 and played < 200:
+        game.push(random.choice(list(game.iter_move_ids(game.current_player_idx))))
+        played += 1
+    for _ in range(played):
+        game.pop()
+
+
+def engine_benchmarks(engine: str, games: list, repeat: int) -> list[dict]:
+    results = []
+
+    def record(name, function, items, calls_per_item=1):
+        rates = _rates(function, items, repeat)
+        rates['ops_per_sec'] *= calls_per_item
+        rates['median_ops_per_sec'] *= calls_per_item
+        results.append({'benchmark': name, 'engine': engine, **rates})
+
+    record('check_winner', lambda game: game.check_winner(), games)
+    record('available_moves', lambda game: game.available_moves(game.current_player_idx), games)
+    record('experimental_available_moves', lambda game: game.experimental_available_moves(game.current_player_idx), games)
+    # one push and one pop per legal move: the rate is in moves applied and undone per second
+    moves = sum(len(list(game.iter_move_ids(game.current_player_idx))) for game in games)
+    record('push_pop', _push_pop, games, moves / len(games))
+    record('random_playout', _random_playout, games)
+    return results
+
+
+def rollout_benchmark(boards: np.ndarray, players: np.ndarray, repeat: int, seed: int) -> dict:
+    '''Vectorized playouts per second of batch_rollout.play_out, all the positions in one batch'''
+    rng = np.random.default_rng(seed)
+    rates = _rates(lambda _: batch_rollout.play_out(boards, players, rng), [None], repeat)
+    return {'benchmark': 'batch_playout', 'engine': 'batch', 'ops_per_sec': rates['ops_per_sec'] * len(boards),
+            'median_ops_per_sec': rates['median_ops_per_sec'] * len(boards), 'calls': len(boards), 'repeat': repeat}
+
+
+def player_benchmark(name: str, engine: str, sequences: list, seed: int) -> dict:
+    '''Seconds per make_move of the player on every position, with the random generators seeded per position'''
+    latencies = []
+    for idx, moves in enumerate(sequences):
+        random.seed(seed + idx)
+        np.random.seed(seed + idx)
+        game = setup(engine, moves)
+        # a new player for every position, of the player to move and without the state of the previous searches
+        # (e.g. the transposition table), created outside of the timed region
+        player = PLAYERS[name](game.current_player_idx)
+        start = time.perf_counter()
+        player.make_move(game)
+        latencies.append(time.perf_counter() - start)
+        player.close()
+    latencies = np.array(latencies)
+    return {'benchmark': f'move.{name}', 'engine': engine, 'moves': len(latencies), 'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)), 'p90': float(np.percentile(latencies, 90)),
+            'max': float(latencies.max())}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(seed: int = 0, num_positions: int = 200, repeat: int = 5, engines: list[str] = None, players: list[str] = None,
+        player_positions: int = 10) -> dict:
+    '''Runs the suite, returns the results with the information on the run'''
+    engines = engines or sorted(ENGINES)
+    players = ['clever', 'minmax', 'montecarlo', 'experiment', 'qlearning'] if players is None else players
+    sequences = positions(seed, num_positions)
+    results = []
+    for engine in engines:
+        random.seed(seed)
+        results += engine_benchmarks(engine, [setup(engine, moves) for moves in sequences], repeat)
+    boards = np.array([setup('bitboard', moves).get_board().flatten() for moves in sequences], dtype=np.int8)
+    results.append(rollout_benchmark(boards, np.array([len(moves) % 2 for moves in sequences]), repeat, seed))
+    for name in players:
+        try:
+            results.append(player_benchmark(name, 'game', sequences[:player_positions], seed))
+        except FileNotFoundError as error:  # QLearningPlayer without its Q-table file
+            results.append({'benchmark': f'move.{name}', 'engine': 'game', 'skipped': str(error)})
+    return {
+        'time': time.time(),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'positions': num_positions,
+        'results': results,
+    }
+
+
+def compare(old: dict, new: dict) -> None:
+    '''Prints the ratio new / old of every benchmark present in both (above 1 is faster)'''
+    def key(result):
+        return result['benchmark'], result['engine']
+    before = {key(result): result for result in old['results']}
+    for result in new['results']:
+        previous = before.get(key(result))
+        if previous is None or 'skipped' in result or 'skipped' in previous:
+            continue
+        if 'ops_per_sec' in result:
+            ratio = result['ops_per_sec'] / previous['ops_per_sec']
+        else:
+            ratio = previous['mean'] / result['mean']
+        print(f"{result['benchmark']:30} {result['engine']:9} {ratio:6.2f}x")
+
+
+def print_results(report: dict) -> None:
+    for result in report['results']:
+        if 'skipped' in result:
+            print(f"{result['benchmark']:30} {result['engine']:9} skipped: {result['skipped']}")
+        elif 'ops_per_sec' in result:
+            print(f"{result['benchmark']:30} {result['engine']:9} {result['ops_per_sec']:14,.0f} ops/s")
+        else:
+            print(f"{result['benchmark']:30} {result['engine']:9} {result['mean'] * 1000:11.2f} ms/move "
+                  f"(p90 {result['p90'] * 1000:.2f} ms)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the Quixo engines and players')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--positions', type=int, default=200, help='positions for the engine benchmarks')
+    parser.add_argument('--player-positions', type=int, default=10, help='positions for the player benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--engines', nargs='*', choices=sorted(ENGINES), default=None)
+    parser.add_argument('--players', nargs='*', choices=sorted(PLAYERS), default=None)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', default=None, help='results of a previous run to compare with')
+    args = parser.parse_args()
+
+    report = run(args.seed, args.positions, args.repeat, args.engines, args.players, args.player_positions)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=1)
+    print_results(report)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), report)
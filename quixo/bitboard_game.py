@@ -0,0 +1,301 @@
+import random
+import numpy as np
+import metrics
+from game import Move, Player, MOVES, MOVE_IDS, LINE_CELLS, MoveClasses, legal_move_mask
+
+# Bitboard version of the Quixo engine. The board is stored as two 25-bit integers, one per player:
+# bit (y * 5 + x) is set if the player owns the cube in column x and row y. A cell with no bit set
+# in either integer is neutral. Every slide and every win check becomes a handful of integer operations.
+
+BOARD_SIZE = 5
+FULL_MASK = (1 << (BOARD_SIZE * BOARD_SIZE)) - 1
+
+
+def _bit(x: int, y: int) -> int:
+    return 1 << (y * BOARD_SIZE + x)
+
+
+# the 12 winning lines of game.LINE_CELLS as bit masks, in the same order check_winner of Game scans them
+WIN_LINES = [sum(1 << cell for cell in line) for line in LINE_CELLS.tolist()]
+
+
+def _build_move_tables():
+    # shift/mask tables for each move of the table shared with Game, indexed by move id
+    src, dst, keep, seg, lshift, rshift = [], [], [], [], [], []
+    for (x, y), slide in MOVES:
+        # cells that shift by one place when the cube is pushed in from the opposite side
+        if slide == Move.LEFT:
+            shifting = [_bit(i, y) for i in range(0, x)]
+            target, left, right = _bit(0, y), 1, 0
+        elif slide == Move.RIGHT:
+            shifting = [_bit(i, y) for i in range(x + 1, BOARD_SIZE)]
+            target, left, right = _bit(BOARD_SIZE - 1, y), 0, 1
+        elif slide == Move.TOP:
+            shifting = [_bit(x, i) for i in range(0, y)]
+            target, left, right = _bit(x, 0), BOARD_SIZE, 0
+        else:
+            shifting = [_bit(x, i) for i in range(y + 1, BOARD_SIZE)]
+            target, left, right = _bit(x, BOARD_SIZE - 1), 0, BOARD_SIZE
+        src.append(_bit(x, y))
+        dst.append(target)
+        seg.append(sum(shifting))
+        keep.append(FULL_MASK ^ (sum(shifting) | _bit(x, y)))
+        lshift.append(left)
+        rshift.append(right)
+    return tuple(src), tuple(dst), tuple(keep), tuple(seg), tuple(lshift), tuple(rshift)
+
+
+_SRC, _DST, _KEEP, _SEG, _LSHIFT, _RSHIFT = _build_move_tables()
+
+
+def winner_of(bits0: int, bits1: int) -> int:
+    '''Returns the winner of the position described by the two bitboards, -1 if there is none'''
+    for line in WIN_LINES:
+        if bits0 & line == line:
+            return 0
+        if bits1 & line == line:
+            return 1
+    return -1
+
+
+def apply_move(move_id: int, own: int, opp: int) -> tuple[int, int]:
+    '''Returns the bitboards (own, opp) after the owner of `own` plays the move `move_id`'''
+    seg, l, r = _SEG[move_id], _LSHIFT[move_id], _RSHIFT[move_id]
+    keep = _KEEP[move_id]
+    own = (own & keep) | (((own & seg) << l) >> r) | _DST[move_id]
+    opp = (opp & keep) | (((opp & seg) << l) >> r)
+    return own, opp
+
+
+class BitboardGame(object):
+    '''
+    Drop-in replacement of Game backed by two integers. It exposes the same methods used by the players,
+    so MinMaxPlayer, MonteCarloPlayer, ExperimentPlayer and CleverPlayer can play on it as they are.
+    '''
+
+    def __init__(self) -> None:
+        self._bits = (0, 0)
+        self.current_player_idx = 1
+        self._undo = []  # undo records of push: (bitboards before the move, previous current player)
+
+    @classmethod
+    def from_board(cls, board: np.ndarray, current_player_idx: int = 1) -> 'BitboardGame':
+        '''Builds a game from a 5x5 board with -1 for neutral pieces and 0/1 for the players pieces'''
+        game = cls()
+        game._board = board
+        game.current_player_idx = current_player_idx
+        return game
+
+    @property
+    def _board(self) -> np.ndarray:
+        # decoded view of the bitboards, kept for the code that reads the board of Game directly
+        return self.get_board()
+
+    @_board.setter
+    def _board(self, board: np.ndarray) -> None:
+        flat = np.asarray(board).flatten()
+        bits0 = sum(1 << i for i, v in enumerate(flat) if v == 0)
+        bits1 = sum(1 << i for i, v in enumerate(flat) if v == 1)
+        self._bits = (bits0, bits1)
+
+    def get_board(self) -> np.ndarray:
+        '''
+        Returns the board
+        '''
+        board = np.full(BOARD_SIZE * BOARD_SIZE, -1, dtype=np.int16)
+        bits0, bits1 = self._bits
+        for i in range(BOARD_SIZE * BOARD_SIZE):
+            if bits0 >> i & 1:
+                board[i] = 0
+            elif bits1 >> i & 1:
+                board[i] = 1
+        return board.reshape((BOARD_SIZE, BOARD_SIZE))
+
+    def get_current_player(self) -> int:
+        '''
+        Returns the current player
+        '''
+        return self.current_player_idx
+
+    def print(self):
+        '''Prints the board. -1 are neutral pieces, 0 are pieces of player 0, 1 pieces of player 1'''
+        print(self.get_board())
+
+    def check_winner(self) -> int:
+        '''Check the winner. Returns the player ID of the winner if any, otherwise returns -1'''
+        metrics.count('bitboard.check_winner')
+        return winner_of(*self._bits)
+
+    def line_counts(self) -> np.ndarray:
+        '''(2, 12) array with the number of pieces of player 0 and player 1 on each line, in the order of WIN_LINES'''
+        return np.array([[bin(bits & line).count('1') for line in WIN_LINES] for bits in self._bits])
+
+    def zobrist_key(self) -> int:
+        '''
+        Key of the position for the transposition table, same role of Game.zobrist_key. The two bitboards
+        and the current player already identify the position, so they are just packed in one integer.
+        '''
+        return self._bits[0] | self._bits[1] << 25 | self.current_player_idx << 50
+
+    def play(self, player1: Player, player2: Player) -> int:
+        '''Play the game. Returns the winning player'''
+        players = [player1, player2]
+        winner = -1
+        while winner < 0:
+            self.current_player_idx += 1
+            self.current_player_idx %= len(players)
+            ok = False
+            while not ok:
+                player = players[self.current_player_idx]
+                with metrics.timer(f'move.{type(player).__name__}'):
+                    from_pos, slide = player.make_move(self)
+                ok = self.__move(from_pos, slide, self.current_player_idx)
+            winner = self.check_winner()
+        return winner
+
+    def _legal_id(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> int:
+        # id of the move in MOVES if the player can perform it, -1 otherwise
+        if player_id not in (0, 1):
+            return -1
+        move_id = MOVE_IDS.get((tuple(from_pos), slide), -1)
+        if move_id < 0 or self._bits[1 - player_id] & _SRC[move_id]:
+            return -1
+        return move_id
+
+    def _result(self, move_id: int, player_id: int) -> tuple[int, int]:
+        # bitboards (player 0, player 1) after the move, the game is left untouched
+        own, opp = apply_move(move_id, self._bits[player_id], self._bits[1 - player_id])
+        return (own, opp) if player_id == 0 else (opp, own)
+
+    def __move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
+        '''Perform a move'''
+        move_id = self._legal_id(from_pos, slide, player_id)
+        if move_id < 0:
+            return False
+        self._bits = self._result(move_id, player_id)
+        return True
+
+    def reward(self):
+        winner = self.check_winner()
+        if winner == 0:
+            return 1
+        elif winner == 1:
+            return -1
+        else:
+            return 0
+
+    def check_move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
+        '''Check if the move is legal without performing it'''
+        return self._legal_id(from_pos, slide, player_id) >= 0
+
+    def my_move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
+        '''Perform a move and pass the turn to the other player'''
+        move_ok = self.__move(from_pos, slide, player_id)
+        if move_ok:
+            self.current_player_idx = (self.current_player_idx + 1) % 2
+        return move_ok
+
+    def push(self, move, player_id: int = None) -> bool:
+        '''Perform the move (a (position, slide) tuple or a move id) and pass the turn, so that pop can undo it'''
+        if player_id is None:
+            player_id = self.current_player_idx
+        if isinstance(move, (int, np.integer)):
+            move_id = move if player_id in (0, 1) and not self._bits[1 - player_id] & _SRC[move] else -1
+        else:
+            move_id = self._legal_id(move[0], move[1], player_id)
+        if move_id < 0:
+            return False
+        self._undo.append((self._bits, self.current_player_idx))
+        self._bits = self._result(move_id, player_id)
+        self.current_player_idx = (self.current_player_idx + 1) % 2
+        return True
+
+    def pop(self) -> None:
+        '''Undo the last move performed with push'''
+        self._bits, self.current_player_idx = self._undo.pop()
+
+    def qlearning_move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
+        '''Perform a move without changing the current player'''
+        return self.__move(from_pos, slide, player_id)
+
+    def iter_move_ids(self, player_idx):
+        '''Yields the ids (indexes in MOVES) of the legal moves of the player'''
+        if player_idx not in (0, 1):
+            return
+        opp = self._bits[1 - player_idx]
+        move_ids = [move_id for move_id, src in enumerate(_SRC) if not opp & src]
+        metrics.count('bitboard.move_generation')
+        metrics.count('bitboard.moves_generated', len(move_ids))
+        yield from move_ids
+
+    def available_moves(self, player_idx) -> list:
+        '''Returns the list of the legal moves (position, slide) of the player'''
+        if player_idx not in (0, 1):
+            return []
+        opp = self._bits[1 - player_idx]
+        moves = [MOVES[i] for i in range(len(MOVES)) if not opp & _SRC[i]]
+        metrics.count('bitboard.move_generation')
+        metrics.count('bitboard.moves_generated', len(moves))
+        return moves
+
+    def legal_move_mask(self, player_idx) -> np.ndarray:
+        '''Legality of every move in MOVES as a boolean array of 44 elements'''
+        return legal_move_mask(self.get_board(), player_idx)[0]
+
+    def classify_moves(self, player_idx) -> MoveClasses:
+        '''Winning, losing and neutral moves of the player (see game.classify_moves), one slide and win test per move'''
+        classes = MoveClasses([], [], [], [])
+        taken = self._bits[0] | self._bits[1]
+        for move_id in self.iter_move_ids(player_idx):
+            winner = winner_of(*self._result(move_id, player_idx))
+            if winner == player_idx:
+                classes.winning.append(move_id)
+            elif winner >= 0:
+                classes.losing.append(move_id)
+            else:
+                classes.neutral.append(move_id)
+                if not taken & _SRC[move_id]:
+                    classes.claims.append(move_id)
+        return classes
+
+    def experimental_available_moves(self, player_idx) -> list:
+        '''Like available_moves, but it returns only a winning move if there is one and drops the losing ones'''
+        classes = self.classify_moves(player_idx)
+        if classes.winning:
+            return [MOVES[classes.winning[0]]]
+        possible_moves = [MOVES[move_id] for move_id in classes.neutral]
+
+        # if every move makes you lose, return one of the legal moves
+        if not possible_moves:
+            legal_moves = self.available_moves(player_idx)
+            if legal_moves:
+                return [random.choice(legal_moves)]
+        return possible_moves
+
+    def clever_available_moves(self, player_idx) -> list:
+        '''Like experimental_available_moves, but it prefers the moves taking a neutral cube'''
+        classes = self.classify_moves(player_idx)
+        if classes.winning:
+            return [MOVES[classes.winning[0]]]
+        possible_moves = [MOVES[move_id] for move_id in classes.neutral]
+        best_possible_moves = [MOVES[move_id] for move_id in classes.claims]
+
+        if not possible_moves:
+            legal_moves = self.available_moves(player_idx)
+            if legal_moves:
+                return [random.choice(legal_moves)]
+        if not best_possible_moves:
+            return possible_moves
+        return best_possible_moves
+
+    def is_loss_move(self, from_pos: tuple[int, int], slide: Move, player_idx: int) -> bool:
+        '''Check if doing the move you lose the game'''
+        move_id = self._legal_id(from_pos, slide, player_idx)
+        bits = self._result(move_id, player_idx) if move_id >= 0 else self._bits
+        return winner_of(*bits) == 1 - player_idx
+
+    def check_victory_move(self, from_pos: tuple[int, int], slide: Move, player_idx: int) -> bool:
+        '''Check if doing the move you win the game'''
+        move_id = self._legal_id(from_pos, slide, player_idx)
+        bits = self._result(move_id, player_idx) if move_id >= 0 else self._bits
+        return winner_of(*bits) == player_idx
@@ -0,0 +1,189 @@
+import argparse
+from abc import ABC, abstractmethod
+import numpy as np
+import metrics
+from game import LINE_CELLS
+from q_table_file import QTableFile, unpack_board
+from q_trainer import play_episode
+from symmetry import canonicalize_boards
+
+# Learned evaluation of positions for the search players. An evaluator scores a whole batch of positions in one call,
+# with a few matrix products, so a search collects the positions it has to evaluate (the children of a node at the
+# horizon of MinMaxPlayer, the children of a node expanded by MCTSPlayer) instead of evaluating them one by one or
+# playing random games from them. The value of a position is the expected result, in [-1, 1], for the player to move.
+# The models see the board as QLearning does, canonical and with the player to move as player 1, and are trained on
+# the positions of the self-play episodes of q_trainer.play_episode, labelled by the result of their game.
+
+NUM_FEATURES = 25 + 25 + 4 * 12 + 1
+
+
+def features(boards: np.ndarray) -> np.ndarray:
+    '''
+    (N, NUM_FEATURES) features of (N, 25) boards with the player to move as player 1: its pieces, the pieces of
+    the opponent, the pieces of both on every line, the lines open for only one of the two (square of the pieces,
+    as the heuristic of MinMaxPlayer) and a constant
+    '''
+    own = (boards == 1).astype(np.float32)
+    other = (boards == 0).astype(np.float32)
+    own_lines = own[:, LINE_CELLS].sum(axis=2)
+    other_lines = other[:, LINE_CELLS].sum(axis=2)
+    return np.concatenate([
+        own, other, own_lines / 5, other_lines / 5,
+        own_lines * own_lines * (other_lines == 0) / 25, other_lines * other_lines * (own_lines == 0) / 25,
+        np.ones((len(boards), 1), dtype=np.float32)], axis=1)
+
+
+def to_move(boards: np.ndarray, players: np.ndarray) -> np.ndarray:
+    '''(N, 25) boards seen by their player to move as player 1: the pieces are swapped where players is 0'''
+    boards = np.asarray(boards).reshape(len(boards), 25).astype(np.int8)
+    swap = (np.asarray(players) == 0)[:, None] & (boards >= 0)
+    return np.where(swap, 1 - boards, boards)
+
+
+class Evaluator(ABC):
+    '''Interface of the evaluators: value of a batch of positions for their player to move'''
+
+    def evaluate(self, boards: np.ndarray, players: np.ndarray) -> np.ndarray:
+        '''(N,) values in [-1, 1] of (N, 5, 5) or (N, 25) boards, `players` being the player to move of every board'''
+        metrics.count('evaluator.batches')
+        metrics.count('evaluator.positions', len(boards))
+        # canonical images, as the boards of the training set
+        return self.predict(features(canonicalize_boards(to_move(boards, players))))
+
+    @abstractmethod
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def parameters(self) -> dict:
+        '''Arrays of the model by name, updated in place by fit'''
+        pass
+
+    @abstractmethod
+    def gradients(self, x: np.ndarray, error: np.ndarray) -> dict:
+        # gradient of the mean squared error, `error` being the prediction minus the target
+        pass
+
+    def fit(self, x: np.ndarray, targets: np.ndarray, epochs: int = 10, batch_size: int = 256, lr: float = 1e-3,
+            seed: int = 0) -> list[float]:
+        '''Minimizes the mean squared error on the features x with Adam. Returns the loss of every epoch'''
+        rng = np.random.default_rng(seed)
+        params = self.parameters()
+        moments = {name: (np.zeros_like(value), np.zeros_like(value)) for name, value in params.items()}
+        beta1, beta2, step = 0.9, 0.999, 0
+        losses = []
+        for _ in range(epochs):
+            order = rng.permutation(len(x))
+            total = 0.0
+            for start in range(0, len(x), batch_size):
+                idx = order[start:start + batch_size]
+                error = self.predict(x[idx]) - targets[idx]
+                total += float((error * error).sum())
+                step += 1
+                for name, gradient in self.gradients(x[idx], error).items():
+                    m, v = moments[name]
+                    m *= beta1
+                    m += (1 - beta1) * gradient
+                    v *= beta2
+                    v += (1 - beta2) * gradient * gradient
+                    params[name] -= lr * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + 1e-8)
+            losses.append(total / len(x))
+        return losses
+
+    def save(self, filename: str) -> None:
+        np.savez(filename, kind=type(self).__name__, **self.parameters())
+
+    @staticmethod
+    def load(filename: str) -> 'Evaluator':
+        '''Evaluator saved by save(), of its class'''
+        with np.load(filename) as data:
+            params = {name: data[name] for name in data.files if name != 'kind'}
+            kind = str(data['kind'])
+        evaluator = EVALUATORS[kind].__new__(EVALUATORS[kind])
+        for name, value in params.items():
+            setattr(evaluator, name, value.astype(np.float32))
+        return evaluator
+
+
+class LinearEvaluator(Evaluator):
+    '''tanh of a weighted sum of the features'''
+
+    def __init__(self, seed: int = 0) -> None:
+        self.w = np.random.default_rng(seed).normal(0, 0.01, NUM_FEATURES).astype(np.float32)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return np.tanh(x @ self.w)
+
+    def parameters(self) -> dict:
+        return {'w': self.w}
+
+    def gradients(self, x: np.ndarray, error: np.ndarray) -> dict:
+        y = np.tanh(x @ self.w)
+        return {'w': x.T @ (2 * error * (1 - y * y)) / len(x)}
+
+
+class MLPEvaluator(Evaluator):
+    '''One hidden layer of ReLU units, tanh output'''
+
+    def __init__(self, hidden: int = 64, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+        self.w1 = rng.normal(0, np.sqrt(2 / NUM_FEATURES), (NUM_FEATURES, hidden)).astype(np.float32)
+        self.b1 = np.zeros(hidden, dtype=np.float32)
+        self.w2 = rng.normal(0, np.sqrt(1 / hidden), hidden).astype(np.float32)
+        self.b2 = np.zeros(1, dtype=np.float32)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return np.tanh(np.maximum(x @ self.w1 + self.b1, 0) @ self.w2 + self.b2)
+
+    def parameters(self) -> dict:
+        return {'w1': self.w1, 'b1': self.b1, 'w2': self.w2, 'b2': self.b2}
+
+    def gradients(self, x: np.ndarray, error: np.ndarray) -> dict:
+        hidden = np.maximum(x @ self.w1 + self.b1, 0)
+        y = np.tanh(hidden @ self.w2 + self.b2)
+        delta = 2 * error * (1 - y * y) / len(x)  # gradient at the input of the tanh
+        delta_hidden = np.outer(delta, self.w2) * (hidden > 0)
+        return {'w1': x.T @ delta_hidden, 'b1': delta_hidden.sum(axis=0), 'w2': hidden.T @ delta,
+                'b2': np.array([delta.sum()], dtype=np.float32)}
+
+
+EVALUATORS = {cls.__name__: cls for cls in (LinearEvaluator, MLPEvaluator)}
+
+
+def self_play_data(episodes: int, seed: int = 0, table=None, eps: float = 1.0, max_moves: int = 200,
+                   discount: float = 0.97) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    (N, 25) canonical boards, with the player to move as player 1, and their targets, from `episodes` self-play games of
+    q_trainer.play_episode (with the Q-table `table` and exploration eps, random games without it). The target of a
+    position is the result of the game for its player to move, discounted by the plies left before the end
+    '''
+    rng = np.random.default_rng(seed)
+    states, targets = [], []
+    for _ in range(episodes):
+        for trajectory, _, reward in play_episode(table, rng, eps, 'self', max_moves):
+            states += trajectory
+            targets += [reward * discount ** (len(trajectory) - 1 - idx) for idx in range(len(trajectory))]
+    boards = np.array([unpack_board(state).flatten() for state in states], dtype=np.int8)
+    return boards, np.array(targets, dtype=np.float32)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Trains an evaluator on self-play games')
+    parser.add_argument('--model', choices=['linear', 'mlp'], default='mlp')
+    parser.add_argument('--episodes', type=int, default=20000)
+    parser.add_argument('--q-table', default=None, help='Q-table file choosing the moves, random games without it')
+    parser.add_argument('--eps', type=float, default=0.3, help='exploration rate of the games with a Q-table')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='evaluator.npz')
+    args = parser.parse_args()
+
+    table = QTableFile(args.q_table) if args.q_table else None
+    boards, targets = self_play_data(args.episodes, args.seed, table, args.eps if table is not None else 1.0)
+    x = features(boards)
+    split = len(x) * 9 // 10
+    evaluator = LinearEvaluator(args.seed) if args.model == 'linear' else MLPEvaluator(seed=args.seed)
+    losses = evaluator.fit(x[:split], targets[:split], args.epochs, seed=args.seed)
+    error = evaluator.predict(x[split:]) - targets[split:]
+    print(f'{len(x)} positions, training loss {losses[-1]:.4f}, validation loss {float((error * error).mean()):.4f}')
+    evaluator.save(args.output)
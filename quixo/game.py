@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
+from collections import namedtuple
 from copy import deepcopy, copy
 from enum import Enum
 import numpy as np
 import random
+import metrics
 
 # Rules on PDF
 
@@ -33,11 +35,169 @@ class Player(ABC):
         '''
         pass
 
+    def close(self) -> None:
+        '''Releases the resources of the player (e.g. its pool of processes), called when it has finished playing'''
+        pass
+
+
+def _slide_allowed(from_pos: tuple[int, int], slide: Move) -> bool:
+    # same rules of Game.__slide, with from_pos in the (X, Y) format: a piece can not be pushed back
+    # into the side it was taken from
+    x, y = from_pos
+    if slide == Move.TOP:
+        return y != 0
+    if slide == Move.BOTTOM:
+        return y != 4
+    if slide == Move.LEFT:
+        return x != 0
+    return x != 4
+
+
+def _build_move_table() -> list:
+    # border cells in the order the moves have always been listed, then every slide allowed from there
+    positions = [(x, y) for x in [0, 4] for y in range(5)] + [(x, y) for y in [0, 4] for x in range(1, 4)]
+    return [(from_pos, slide) for from_pos in positions for slide in Move if _slide_allowed(from_pos, slide)]
+
+
+# The geometry of the board never changes, so the 44 legal (position, slide) pairs are computed once.
+# A move id is the index of the move in MOVES, MOVE_CELLS is the flat index (Y * 5 + X) of the piece it takes.
+MOVES = _build_move_table()
+MOVE_IDS = {move: idx for idx, move in enumerate(MOVES)}
+MOVE_CELLS = np.array([y * 5 + x for (x, y), _ in MOVES])
+_MOVE_CELL_LIST = MOVE_CELLS.tolist()
+_MOVE_ROWCOL = [(y, x) for (x, y), _ in MOVES]
+
+
+def _build_slide_table() -> tuple[list, list, list]:
+    # for each move: the index of the row/column it changes, the permutation of that line made by the
+    # slide and the position in the line where the taken piece ends up
+    lines, perms, targets = [], [], []
+    for (x, y), slide in MOVES:
+        if slide in (Move.LEFT, Move.RIGHT):
+            lines.append((y, slice(None)))
+            start = x
+        else:
+            lines.append((slice(None), x))
+            start = y
+        perm = list(range(5))
+        piece = perm.pop(start)
+        if slide in (Move.LEFT, Move.TOP):
+            perm.insert(0, piece)
+        else:
+            perm.append(piece)
+        perms.append(np.array(perm))
+        targets.append(perm.index(piece))
+    return lines, perms, targets
+
+
+_MOVE_LINE, _MOVE_PERM, MOVE_TARGETS = _build_slide_table()
+_ROW_CELLS = [[y * 5 + x for x in range(5)] for y in range(5)]
+_COL_CELLS = [[y * 5 + x for y in range(5)] for x in range(5)]
+# the 12 lines (flat indexes) in the order check_winner scans them: rows, columns, principal and secondary diagonal
+LINE_CELLS = np.array(_ROW_CELLS + _COL_CELLS + [[i * 5 + i for i in range(5)], [i * 5 + 4 - i for i in range(5)]])
+# the slide table on the flat board, shared with the other engines: for each move the cells (flat indexes) of the line
+# it slides, the order of the line after the slide (MOVE_PERMS, indexes in the line) and the position in the line
+# where the taken piece ends up (MOVE_TARGETS)
+MOVE_LINE_CELLS = [_ROW_CELLS[y] if slide in (Move.LEFT, Move.RIGHT) else _COL_CELLS[x] for (x, y), slide in MOVES]
+_LINE_CELL_LIST = LINE_CELLS.tolist()
+# lines (indexes in LINE_CELLS) through every cell
+_CELL_LINES = [[line for line, cells in enumerate(_LINE_CELL_LIST) if cell in cells] for cell in range(25)]
+MOVE_PERMS = [perm.tolist() for perm in _MOVE_PERM]
+
+
+def _build_crossing_table() -> tuple[list, list]:
+    # for each move: the index in LINE_CELLS of the row/column it slides, and the other lines crossing it as
+    # (line index, position of the crossing cell in the slid line). Any other line shares at most one cell with it
+    slid, crossings = [], []
+    for move_id, ((x, y), slide) in enumerate(MOVES):
+        cells = MOVE_LINE_CELLS[move_id]
+        slid.append(y if slide in (Move.LEFT, Move.RIGHT) else 5 + x)
+        crossings.append([(line, cells.index(cell)) for line, line_cells in enumerate(_LINE_CELL_LIST)
+                          if line != slid[-1] for cell in line_cells if cell in cells])
+    return slid, crossings
+
+
+_MOVE_SLID_LINE, _MOVE_CROSSINGS = _build_crossing_table()
+
+# result of classify_moves: lists of move ids, in the order of MOVES
+MoveClasses = namedtuple('MoveClasses', ['winning', 'losing', 'neutral', 'claims'])
+
+
+def classify_moves(cells: list, player_idx: int, counts: list = None) -> MoveClasses:
+    '''
+    Classifies the legal moves of the player on the flat board `cells` (list of 25 values) by the winner that
+    check_winner would return after them: winning, losing or neutral (no winner). claims are the neutral moves taking
+    a neutral cube. Every move is applied only to the slid line, and only the lines crossing it are checked, using
+    the number of pieces of each player on every line (counts[player][line], computed if not given).
+    '''
+    if counts is None:
+        counts = [[sum(cells[cell] == player for cell in line) for line in _LINE_CELL_LIST] for player in (0, 1)]
+    # lines already complete: they stay complete unless the move changes them
+    complete = [(line, player) for player in (0, 1) for line in range(len(_LINE_CELL_LIST)) if counts[player][line] == 5]
+    classes = MoveClasses([], [], [], [])
+    for move_id, cell in enumerate(_MOVE_CELL_LIST):
+        if cells[cell] >= 0 and cells[cell] != player_idx:
+            continue
+        line = [cells[c] for c in MOVE_LINE_CELLS[move_id]]
+        new = [line[i] for i in MOVE_PERMS[move_id]]
+        new[MOVE_TARGETS[move_id]] = player_idx
+        slid = _MOVE_SLID_LINE[move_id]
+        # complete lines after the move as (line index, owner): the first one is the line check_winner finds
+        winners = [(slid, new[0])] if new[0] >= 0 and new.count(new[0]) == 5 else []
+        for crossing, k in _MOVE_CROSSINGS[move_id]:
+            value = new[k]
+            if value >= 0 and counts[value][crossing] + (line[k] != value) == 5:
+                winners.append((crossing, value))
+        if complete:
+            touched = {slid} | {crossing for crossing, _ in _MOVE_CROSSINGS[move_id]}
+            winners += [entry for entry in complete if entry[0] not in touched]
+        winner = min(winners)[1] if winners else -1
+        if winner == player_idx:
+            classes.winning.append(move_id)
+        elif winner >= 0:
+            classes.losing.append(move_id)
+        else:
+            classes.neutral.append(move_id)
+            if cells[cell] < 0:
+                classes.claims.append(move_id)
+    return classes
+
+# Zobrist keys: ZOBRIST[cell][value + 1] for the values -1 (neutral, key 0), 0, 1 and 2 of a cell,
+# ZOBRIST_SIDE is added when player 1 is the current player. Fixed seed, so keys are the same in every process.
+_zobrist_rng = np.random.default_rng(20231224)
+ZOBRIST = [[0] + [int(k) for k in _zobrist_rng.integers(1, 2 ** 63, size=3)] for _ in range(25)]
+ZOBRIST_SIDE = int(_zobrist_rng.integers(1, 2 ** 63))
+
+
+def legal_move_mask(boards: np.ndarray, player_idx) -> np.ndarray:
+    '''
+    Batched legality test. boards is a (N, 5, 5) or (N, 25) array of boards, player_idx the player to move
+    (a single id or one per board). Returns a (N, 44) boolean array, True where MOVES[i] is legal on the board.
+    '''
+    cells = np.asarray(boards).reshape(-1, 25)[:, MOVE_CELLS]
+    player_idx = np.asarray(player_idx).reshape(-1, 1)
+    return (cells < 0) | (cells == player_idx)
+
 
 class Game(object):
     def __init__(self) -> None: 
         self._board = np.ones((5, 5), dtype=np.uint8) * -1
         self.current_player_idx = 1  
+        self._undo = []  # undo records of push: (move id, row/column before the move, previous current player, hash, line counts)
+        self._hash = 0  # Zobrist hash of the board, updated by every take/slide. Write the board only through the moves
+        # number of pieces of player 0 and player 1 on each line of LINE_CELLS, updated with the hash. The lists are
+        # replaced, never modified, so the undo records of push can keep them
+        self._counts = ([0] * len(LINE_CELLS), [0] * len(LINE_CELLS))
+
+    @classmethod
+    def from_board(cls, board: np.ndarray, current_player_idx: int = 1) -> 'Game':
+        '''Builds a game from a 5x5 board with -1 for neutral pieces and 0/1 for the players pieces'''
+        game = cls()
+        for pos, value in np.ndenumerate(np.asarray(board)):
+            if value >= 0:
+                game._put(pos, int(value))
+        game.current_player_idx = current_player_idx
+        return game
 
     def get_board(self) -> np.ndarray:
         '''
@@ -57,33 +217,49 @@ class Game(object):
 
     def check_winner(self) -> int:
         '''Check the winner. Returns the player ID of the winner if any, otherwise returns -1'''
-        # for each row
-        for x in range(self._board.shape[0]):
-            # if a player has completed an entire row
-            if self._board[x, 0] != -1 and all(self._board[x, :] == self._board[x, 0]):
-                # return the relative id
-                return self._board[x, 0]
-        # for each column
-        for y in range(self._board.shape[1]):
-            # if a player has completed an entire column
-            if self._board[0, y] != -1 and all(self._board[:, y] == self._board[0, y]):
-                # return the relative id
-                return self._board[0, y]
-        # if a player has completed the principal diagonal
-        if self._board[0, 0] != -1 and all(
-            [self._board[x, x]
-                for x in range(self._board.shape[0])] == self._board[0, 0]
-        ):
-            # return the relative id
-            return self._board[0, 0]
-        # if a player has completed the secondary diagonal
-        if self._board[0, -1] != -1 and all(
-            [self._board[x, -(x + 1)]
-             for x in range(self._board.shape[0])] == self._board[0, -1]
-        ):
-            # return the relative id 
-            return self._board[0, -1]
-        return -1 #If neither of the two has won yet, return -1
+        metrics.count('game.check_winner')
+        # a line is complete when one player has 5 pieces on it. The lines are tried in the order of LINE_CELLS
+        # (rows, columns, principal and secondary diagonal), the first complete one gives the winner
+        counts0, counts1 = self._counts
+        if 5 not in counts0 and 5 not in counts1:
+            return -1 #If neither of the two has won yet, return -1
+        for line in range(len(counts0)):
+            if counts0[line] == 5:
+                return 0
+            if counts1[line] == 5:
+                return 1
+        return -1
+
+    def line_counts(self) -> np.ndarray:
+        '''(2, 12) array with the number of pieces of player 0 and player 1 on each line, in the order of LINE_CELLS'''
+        return np.array(self._counts)
+
+    def zobrist_key(self) -> int:
+        '''Zobrist hash of the position: the board and the current player'''
+        return self._hash ^ ZOBRIST_SIDE if self.current_player_idx == 1 else self._hash
+
+    def _update_cells(self, cells: list, before: list) -> None:
+        # update the hash and the line counts with the cells (flat indexes) that changed from the values in `before`
+        after = self._board.ravel()[cells].tolist()
+        counts = None
+        for cell, old, new in zip(cells, before, after):
+            if old != new:
+                self._hash ^= ZOBRIST[cell][old + 1] ^ ZOBRIST[cell][new + 1]
+                if counts is None:
+                    counts = (self._counts[0][:], self._counts[1][:])
+                for line in _CELL_LINES[cell]:
+                    if old >= 0:
+                        counts[old][line] -= 1
+                    if new >= 0:
+                        counts[new][line] += 1
+        if counts is not None:
+            self._counts = counts
+
+    def _put(self, pos: tuple[int, int], value: int) -> None:
+        # write a single cell, pos in the (row, column) format of the board
+        before = [int(self._board[pos])]
+        self._board[pos] = value
+        self._update_cells([pos[0] * 5 + pos[1]], before)
 
     def play(self, player1: Player, player2: Player) -> int:
         '''Play the game. Returns the winning player'''
@@ -94,15 +270,16 @@ class Game(object):
             self.current_player_idx %= len(players)
             ok = False
             while not ok:
-                from_pos, slide = players[self.current_player_idx].make_move( 
-                    self) 
+                player = players[self.current_player_idx]
+                with metrics.timer(f'move.{type(player).__name__}'):
+                    from_pos, slide = player.make_move(self)
                 ok = self.__move(from_pos, slide, self.current_player_idx) #It's the __move function that modifies the board, not make_move.
             winner = self.check_winner()
         return winner
     
     def __move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool: #Takes a position, a move, and a player ID. It performs a move if it is valid
         '''Perform a move'''
-        if player_id > 2:
+        if player_id not in (0, 1):
             return False
         # Oh God, Numpy arrays
         prev_value = deepcopy(self._board[(from_pos[1], from_pos[0])])
@@ -110,7 +287,7 @@ class Game(object):
         if acceptable:
             acceptable = self.__slide((from_pos[1], from_pos[0]), slide) 
             if not acceptable:
-                self._board[(from_pos[1], from_pos[0])] = deepcopy(prev_value)
+                self._put((from_pos[1], from_pos[0]), prev_value)
         return acceptable
 
     def __take(self, from_pos: tuple[int, int], player_id: int) -> bool: #Takes a position and a player ID. It handles the process of a player taking a piece.
@@ -128,7 +305,7 @@ class Game(object):
             # and check if the piece can be moved by the current player
         ) and (self._board[from_pos] < 0 or self._board[from_pos] == player_id) #check if in the element there is -1 or your id
         if acceptable:
-            self._board[from_pos] = player_id
+            self._put(from_pos, player_id)
         return acceptable
 
     def __slide(self, from_pos: tuple[int, int], slide: Move) -> bool: #Takes a position and a move. It handles the process of sliding pieces after a move.
@@ -171,6 +348,9 @@ class Game(object):
         acceptable: bool = acceptable_top or acceptable_bottom or acceptable_left or acceptable_right
         # if it is
         if acceptable:
+            # the row or the column that is going to change, to update the hash at the end
+            cells = _ROW_CELLS[from_pos[0]] if slide in (Move.LEFT, Move.RIGHT) else _COL_CELLS[from_pos[1]]
+            before = self._board.ravel()[cells].tolist()
             # take the piece
             piece = self._board[from_pos]
             # if the player wants to slide it to the left
@@ -209,6 +389,7 @@ class Game(object):
                         i + 1, from_pos[1])]
                 # move the piece down
                 self._board[(self._board.shape[0] - 1, from_pos[1])] = piece
+            self._update_cells(cells, before)
         return acceptable
 
 #My functions
@@ -222,49 +403,20 @@ class Game(object):
 
     #check if it's possible to do a move without use the private functions _take and _slide in a faster way
     def check_move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
-        '''Perform a move'''
-        if player_id > 2:
+        '''Check if the move is legal, using the precomputed move table'''
+        if player_id not in (0, 1):
             return False
-        app = (from_pos[1], from_pos[0])
-        # Check take
-        acceptable_take = (
-            (app[0] == 0 and app[1] < 5)
-            or (app[0] == 4 and app[1] < 5)
-            or (app[1] == 0 and app[0] < 5)
-            or (app[1] == 4 and app[0] < 5)
-        ) and (self._board[app] < 0 or self._board[app] == player_id)
-
-        # Check slide
-        SIDES = [(0, 0), (0, 4), (4, 0), (4, 4)]
-        if app not in SIDES:
-            acceptable_top = app[0] == 0 and (
-                slide == Move.BOTTOM or slide == Move.LEFT or slide == Move.RIGHT
-            )
-            acceptable_bottom = app[0] == 4 and (
-                slide == Move.TOP or slide == Move.LEFT or slide == Move.RIGHT
-            )
-            acceptable_left = app[1] == 0 and (
-                slide == Move.BOTTOM or slide == Move.TOP or slide == Move.RIGHT
-            )
-            acceptable_right = app[1] == 4 and (
-                slide == Move.BOTTOM or slide == Move.TOP or slide == Move.LEFT
-            )
-        else:
-            acceptable_top = app == (0, 0) and (
-                slide == Move.BOTTOM or slide == Move.RIGHT)
-            acceptable_left = app == (4, 0) and (
-                slide == Move.TOP or slide == Move.RIGHT)
-            acceptable_right = app == (0, 4) and (
-                slide == Move.BOTTOM or slide == Move.LEFT)
-            acceptable_bottom = app == (4, 4) and (
-                slide == Move.TOP or slide == Move.LEFT)
-
-        return acceptable_take and (acceptable_top or acceptable_bottom or acceptable_left or acceptable_right)
+        move_id = MOVE_IDS.get((tuple(from_pos), slide))
+        if move_id is None:
+            return False
+        # the geometry is already valid, only the owner of the piece has to be checked
+        piece = self._board[_MOVE_ROWCOL[move_id]]
+        return piece < 0 or piece == player_id
 
     # to call the move externally on a game deepcopy.
     def my_move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
         '''Perform a move'''
-        if player_id > 2:
+        if player_id not in (0, 1):
             return False
         #save the state of the board and then you restore it if the move is not valid
         prev_value = deepcopy(self._board[(from_pos[1], from_pos[0])])
@@ -275,7 +427,7 @@ class Game(object):
             if take_ok:
                 slide_ok = self.__slide(pos, slide)
                 if not slide_ok:
-                    self._board[pos] = deepcopy(prev_value)
+                    self._put(pos, prev_value)
                 return slide_ok
             return False
         
@@ -286,10 +438,39 @@ class Game(object):
         
         return move_ok
     
+    # make/unmake interface for the search players: push performs a move (a (position, slide) tuple
+    # or a move id) saving only the row/column it changes, pop restores the position before it.
+    def push(self, move, player_id: int = None) -> bool:
+        '''Perform the move of the player (the current one by default) and pass the turn. Returns False if it is not legal'''
+        if player_id is None:
+            player_id = self.current_player_idx
+        move_id = move if isinstance(move, (int, np.integer)) else MOVE_IDS.get((tuple(move[0]), move[1]))
+        if move_id is None or player_id not in (0, 1):
+            return False
+        piece = self._board[_MOVE_ROWCOL[move_id]]
+        if piece >= 0 and piece != player_id:
+            return False
+        line = self._board[_MOVE_LINE[move_id]]
+        saved = line.copy()
+        self._undo.append((move_id, saved, self.current_player_idx, self._hash, self._counts))
+        line[:] = saved[_MOVE_PERM[move_id]]
+        line[MOVE_TARGETS[move_id]] = player_id
+        self._update_cells(MOVE_LINE_CELLS[move_id], saved.tolist())
+        self.current_player_idx = (self.current_player_idx + 1) % 2
+        return True
+
+    def pop(self) -> None:
+        '''Undo the last move performed with push'''
+        move_id, saved, player_idx, board_hash, counts = self._undo.pop()
+        self._board[_MOVE_LINE[move_id]] = saved
+        self.current_player_idx = player_idx
+        self._hash = board_hash
+        self._counts = counts
+
     #used in QlearningPlayer. We don't need to change player here  
     def qlearning_move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool: #Takes a position, a move, and a player ID. It performs a move if it is valid
         '''Perform a move'''
-        if player_id > 2:
+        if player_id not in (0, 1):
             return False
         # Oh God, Numpy arrays
         prev_value = deepcopy(self._board[(from_pos[1], from_pos[0])])
@@ -297,56 +478,38 @@ class Game(object):
         if acceptable:
             acceptable = self.__slide((from_pos[1], from_pos[0]), slide)
             if not acceptable:
-                self._board[(from_pos[1], from_pos[0])] = deepcopy(prev_value)
+                self._put((from_pos[1], from_pos[0]), prev_value)
         return acceptable
     
+    #give the ids (indexes in MOVES) of all the legal moves, one at a time
+    def iter_move_ids(self, player_idx):
+        if player_idx not in (0, 1):
+            return
+        cells = self._board.ravel().tolist()
+        move_ids = [move_id for move_id, cell in enumerate(_MOVE_CELL_LIST) if cells[cell] < 0 or cells[cell] == player_idx]
+        metrics.count('game.move_generation')
+        metrics.count('game.moves_generated', len(move_ids))
+        yield from move_ids
+
     #give a list of all the legal moves (position, slide, player_id)
     def available_moves(self, player_idx) -> list:
-        possible_moves = []
-
-        # Iterate over the edges
-        for y in [0, 4]:
-            for x in range(5):
-                from_pos = (y, x)
-                for slide in Move:
-                    if self.check_move(from_pos, slide, player_idx):
-                        possible_moves.append((from_pos, slide))
-
-        for x in [0, 4]:
-            for y in range(1, 4):
-                from_pos = (y, x)
-                for slide in Move:
-                    if self.check_move(from_pos, slide, player_idx):
-                        possible_moves.append((from_pos, slide))
+        return [MOVES[move_id] for move_id in self.iter_move_ids(player_idx)]
 
-        return possible_moves
+    #legality of every move in MOVES as a boolean array of 44 elements
+    def legal_move_mask(self, player_idx) -> np.ndarray:
+        return legal_move_mask(self._board, player_idx)[0]
     
+    #winning, losing and neutral moves of the player (and the neutral moves taking a neutral cube), in one pass over the moves
+    def classify_moves(self, player_idx) -> MoveClasses:
+        return classify_moves(self._board.ravel().tolist(), player_idx, self._counts)
+
     #like the function above but you also check if there's a move that allows you to win and it filters the moves that make you loss
     def experimental_available_moves(self, player_idx) -> list:
-        possible_moves = []
-
-        # Iterate over the edges
-        for y in [0, 4]:
-            for x in range(5):
-                from_pos = (y, x)
-                for slide in Move:
-                    if self.check_move(from_pos, slide, player_idx):
-                        #if the move bring to the victory, return only it in the possible moves
-                        if self.check_victory_move(from_pos, slide, player_idx):
-                            return [(from_pos, slide)]  
-                        # check if the move make you lose
-                        if not self.is_loss_move(from_pos, slide, player_idx):
-                            possible_moves.append((from_pos, slide))
-
-        for x in [0, 4]:
-            for y in range(1, 4):
-                from_pos = (y, x)
-                for slide in Move:
-                    if self.check_move(from_pos, slide, player_idx):
-                        if self.check_victory_move(from_pos, slide, player_idx):
-                            return [(from_pos, slide)] 
-                        if not self.is_loss_move(from_pos, slide, player_idx):
-                            possible_moves.append((from_pos, slide))
+        classes = self.classify_moves(player_idx)
+        #if a move brings to the victory, return only it in the possible moves
+        if classes.winning:
+            return [MOVES[classes.winning[0]]]
+        possible_moves = [MOVES[move_id] for move_id in classes.neutral]
 
         # if every move make you lose, the possible_moves will be empty, so you return the legal moves
         if not possible_moves:
@@ -359,39 +522,12 @@ class Game(object):
     #like the function above but when you have to choose an element you prefer the element of the board without your symbol
     #in this way you put more element on the board under your control. At the end you will have an advantage
     def clever_available_moves(self, player_idx) -> list:
-        possible_moves = []
-        best_possible_moves = []
-
-        # Iterate over the edges
-        for y in [0, 4]:
-            for x in range(5):
-                from_pos = (y, x)
-                for slide in Move:
-                    if self.check_move(from_pos, slide, player_idx):
-                        #if the move bring to the victory, return only it in the possible moves
-                        if self.check_victory_move(from_pos, slide, player_idx):
-                            return [(from_pos, slide)]  
-                        # check if the move make you lose
-                        if not self.is_loss_move(from_pos, slide, player_idx):
-                            possible_moves.append((from_pos, slide))
-                            target_value = self._board[y, x]
-                            # add the move only if the target is -1
-                            if target_value == -1:
-                                best_possible_moves.append((from_pos, slide))
-
-
-        for x in [0, 4]:
-            for y in range(1, 4):
-                from_pos = (y, x)
-                for slide in Move:
-                    if self.check_move(from_pos, slide, player_idx):
-                        if self.check_victory_move(from_pos, slide, player_idx):
-                            return [(from_pos, slide)]
-                        if not self.is_loss_move(from_pos, slide, player_idx):
-                            possible_moves.append((from_pos, slide))
-                            target_value = self._board[y, x]
-                            if target_value == -1:
-                                best_possible_moves.append((from_pos, slide))
+        classes = self.classify_moves(player_idx)
+        if classes.winning:
+            return [MOVES[classes.winning[0]]]
+        possible_moves = [MOVES[move_id] for move_id in classes.neutral]
+        # the moves taking a cube that is still neutral
+        best_possible_moves = [MOVES[move_id] for move_id in classes.claims]
 
         # if every move make you lose, the possible_moves will be empty, so you return the legal moves
         if not possible_moves:
@@ -404,23 +540,19 @@ class Game(object):
 
     #check if doing the move you loss the game
     def is_loss_move(self, from_pos: tuple[int, int], slide: Move, player_idx: int) -> bool:
-        # Save the original board
-        original_board = deepcopy(self._board)
-        self.__move(from_pos, slide, player_idx)
+        # Perform the move and undo it after the check
+        done = self.push((from_pos, slide), player_idx)
         is_loss = self.check_winner() == 1 - player_idx
-
-        # Restore the board before the simulation of the move
-        self._board = original_board
+        if done:
+            self.pop()
         return is_loss
  
     
     def check_victory_move(self, from_pos: tuple[int, int], slide: Move, player_idx: int) -> bool:
-        # Save the original board
-        original_board = deepcopy(self._board)
-        self.__move(from_pos, slide, player_idx)
+        # Perform the move and undo it after the check
+        done = self.push((from_pos, slide), player_idx)
         is_victory = self.check_winner() == player_idx
-
-        # Restore the board before the simulation of the move
-        self._board = original_board
-
+        if done:
+            self.pop()
         return is_victory
+
@@ -1,11 +1,6 @@
 import random
-from tqdm import tqdm
 from game import Game, Move, Player
-from minmax_player import MinMaxPlayer
-from qlearning_player import QLearningPlayer
-from monte_carlo_player import MonteCarloPlayer
-from experiment_player import ExperimentPlayer
-from clever_player import CleverPlayer
+import tournament
 
 
 class RandomPlayer(Player):
@@ -31,25 +26,21 @@ class MyPlayer(Player):
 
 if __name__ == '__main__':
 
-    g = Game()
-    #player1 = MinMaxPlayer()
-    #player1 = QLearningPlayer()
-    #player1 = MonteCarloPlayer()
-    player1 = ExperimentPlayer()
-    player2 = RandomPlayer()
-    #player2 = CleverPlayer()
-
-    player1_wins=0
-    for i in tqdm(range(1,1001)):
-        winner = g.play(player1, player2)
-        g.print()
-        if winner==0:
-            player1_wins+=1
-        tqdm.write(f"Game: {i}, wins: {player1_wins}")
-        g=Game()
-
-    print(f"Wins: {player1_wins}/1000")
-    print(f"Winner: Player {winner}")
+    # the games are played in parallel by the tournament runner, player 0 moves first in even games
+    # and second in odd games. Available players: random, clever, minmax, montecarlo, experiment, mcts, qlearning
+    player1 = 'experiment'
+    player2 = 'random'
+    #player2 = 'clever'
+
+    results = tournament.run(tournament.schedule([player1, player2], games_per_pair=1000, seed=0))
+    stats = tournament.summarize(results)
+    tournament.print_summary(stats)
+    # player1 moves first in only half of the games: wins split by who moved first
+    first = [r for r in results if r['players'][0] == player1]
+    second = [r for r in results if r['players'][1] == player1]
+    print(f"Wins: {stats[player1][player2]['wins']}/{len(results)} "
+          f"({sum(r['winner'] == 0 for r in first)}/{len(first)} moving first, "
+          f"{sum(r['winner'] == 1 for r in second)}/{len(second)} moving second)")
 
 #MinMax with recursion of depth=2 with pruning alpha>=beta results: 641/1000 = 64.1% of wins 
 #QleaningPlayer  55.1% win
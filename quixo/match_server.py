@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import metrics
+from game import Move, Player, MOVE_IDS
+from tournament import PLAYERS, ENGINES
+
+# Asyncio server hosting many Quixo matches at the same time. External agents connect with TCP (or a Unix socket)
+# and speak JSON lines:
+#   agent -> server  {"type": "hello", "name": "my-bot", "opponent": "clever", "seat": 1}
+#                    opponent (optional) is a built-in player of tournament.PLAYERS, without it the agent waits for
+#                    another agent. seat (optional, default 0) is the index of the agent when it plays a built-in.
+#   server -> agent  {"type": "start", "player": 0, "opponent": "clever"}
+#   server -> agent  {"type": "turn", "board": [[...5 rows...]], "player": 0, "timeout": 5.0}
+#   agent -> server  {"type": "move", "from": [x, y], "slide": "TOP"}      (slide by name or by value)
+#   server -> agent  {"type": "illegal", "remaining": 9}                   the agent has to send another move
+#   server -> agent  {"type": "end", "winner": 1, "reason": "win"}         then a new hello starts a new match
+# A player that does not answer within the move timeout, proposes more than max_illegal illegal moves in a turn or
+# disconnects loses the match. The built-in players that search run in a pool of processes, so they do not block
+# the event loop; the quick ones (LIGHT_PLAYERS) run in the loop.
+
+LIGHT_PLAYERS = {'random', 'clever'}
+_worker_players = {}  # players of a worker process, by (name, player index), kept across moves and matches
+
+
+def _builtin_move(name: str, player_idx: int, board: list, engine: str) -> tuple:
+    # runs in a worker process: move of the built-in player on a copy of the game and the seconds it took, measured
+    # from the start of the job, so the time waiting for a free worker does not count
+    start = time.perf_counter()
+    key = (name, player_idx)
+    if key not in _worker_players:
+        _worker_players[key] = PLAYERS[name](player_idx)
+        Finalize(_worker_players[key], _worker_players[key].close, exitpriority=10)  # closed when the worker exits
+    from_pos, slide = _worker_players[key].make_move(ENGINES[engine].from_board(np.array(board), player_idx))
+    return tuple(from_pos), slide.value, time.perf_counter() - start
+
+
+class ProtocolError(Exception):
+    '''Raised when an agent sends a message that does not follow the protocol'''
+    pass
+
+
+class Seat(ABC):
+    '''One side of a match: gives the move of the player, within the timeout'''
+    name = 'seat'
+
+    async def start(self, player_idx: int, opponent: str) -> None:
+        pass
+
+    @abstractmethod
+    async def move(self, game, player_idx: int, timeout: float) -> tuple[tuple[int, int], Move]:
+        pass
+
+    async def illegal(self, remaining: int) -> None:
+        pass
+
+    async def end(self, winner: int, reason: str) -> None:
+        pass
+
+
+class AgentSeat(Seat):
+    '''External agent connected to the server'''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, name: str) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+
+    async def send(self, message: dict) -> None:
+        self.writer.write((json.dumps(message) + '\n').encode())
+        await self.writer.drain()
+
+    async def receive(self, timeout: float = None) -> dict:
+        line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not line:
+            raise ConnectionResetError('the agent has disconnected')
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            raise ProtocolError(f'not a JSON message: {line[:100]!r}')
+
+    async def start(self, player_idx: int, opponent: str) -> None:
+        await self.send({'type': 'start', 'player': player_idx, 'opponent': opponent})
+
+    async def move(self, game, player_idx: int, timeout: float) -> tuple[tuple[int, int], Move]:
+        await self.send({'type': 'turn', 'board': game.get_board().tolist(), 'player': player_idx, 'timeout': timeout})
+        message = await self.receive(timeout)
+        try:
+            slide = message['slide']
+            slide = Move[slide] if isinstance(slide, str) else Move(slide)
+            x, y = message['from']
+            return (int(x), int(y)), slide
+        except (KeyError, ValueError, TypeError):
+            raise ProtocolError(f'not a move: {message}')
+
+    async def illegal(self, remaining: int) -> None:
+        await self.send({'type': 'illegal', 'remaining': remaining})
+
+    async def end(self, winner: int, reason: str) -> None:
+        await self.send({'type': 'end', 'winner': winner, 'reason': reason})
+
+
+class BuiltinSeat(Seat):
+    '''Player of tournament.PLAYERS, in the event loop or in the executor (a pool of processes)'''
+
+    def __init__(self, name: str, executor: ProcessPoolExecutor, engine: str) -> None:
+        self.name = name
+        self.executor = executor
+        self.engine = engine
+        self.player = None
+
+    async def start(self, player_idx: int, opponent: str) -> None:
+        if self.name in LIGHT_PLAYERS:
+            self.player = PLAYERS[self.name](player_idx)
+
+    async def end(self, winner: int, reason: str) -> None:
+        if self.player is not None:
+            self.player.close()
+            self.player = None
+
+    async def move(self, game, player_idx: int, timeout: float) -> tuple[tuple[int, int], Move]:
+        if self.player is not None:
+            return self.player.make_move(ENGINES[self.engine].from_board(game.get_board(), player_idx))
+        loop = asyncio.get_running_loop()
+        # the timeout is checked against the time of the search in the worker: with many matches the job can wait
+        # in the queue of the executor, and that wait is not the player's
+        from_pos, slide, elapsed = await loop.run_in_executor(self.executor, _builtin_move, self.name, player_idx,
+                                                              game.get_board().tolist(), self.engine)
+        if timeout is not None and elapsed > timeout:
+            raise asyncio.TimeoutError
+        return from_pos, Move(slide)
+
+
+class PlayerSeat(Seat):
+    '''A Player object of this process, called in the event loop (for tests and local scripts)'''
+
+    def __init__(self, player: Player, name: str = None) -> None:
+        self.player = player
+        self.name = name or type(player).__name__
+
+    async def move(self, game, player_idx: int, timeout: float) -> tuple[tuple[int, int], Move]:
+        return self.player.make_move(game)
+
+
+class MatchServer(object):
+    '''
+    Hosts the matches: every connection and every match is a task of the event loop.
+    The results of the finished matches are kept in `results`, as the ones of tournament.play_game.
+    '''
+
+    def __init__(self, move_timeout: float = 5.0, max_illegal: int = 100, max_moves: int = 1000, engine: str = 'game',
+                 workers: int = None) -> None:
+        self.move_timeout = move_timeout
+        self.max_illegal = max_illegal
+        self.max_moves = max_moves
+        self.engine = engine
+        self.executor = ProcessPoolExecutor(workers or os.cpu_count())
+        self.waiting = None  # agent waiting for an opponent, with the future of the end of its match
+        self.results = []
+        self.running = 0
+
+    async def play(self, seat0: Seat, seat1: Seat) -> dict:
+        '''Plays a match between the two seats, seat0 moves first'''
+        seats = [seat0, seat1]
+        game = ENGINES[self.engine]()
+        self.running += 1
+        winner, reason, moves = -1, 'max_moves', 0
+        try:
+            await asyncio.gather(seat0.start(0, seat1.name), seat1.start(1, seat0.name))
+            while moves < self.max_moves:
+                game.current_player_idx = moves % 2
+                player_idx = game.current_player_idx
+                winner, reason = await self.turn(game, seats[player_idx], player_idx)
+                if winner >= 0:
+                    break
+                moves += 1
+                winner = game.check_winner()
+                if winner >= 0:
+                    reason = 'win'
+                    break
+        finally:
+            self.running -= 1
+        result = {'players': [seat0.name, seat1.name], 'winner': int(winner), 'reason': reason, 'moves': moves}
+        self.results.append(result)
+        metrics.count(f'server.{reason}')
+        for seat in seats:
+            try:
+                await seat.end(int(winner), reason)
+            except (ConnectionError, OSError):
+                pass
+        return result
+
+    async def turn(self, game, seat: Seat, player_idx: int) -> tuple[int, str]:
+        # asks the move until it is legal. Returns (winner, reason) when the turn ends the match, (-1, '') otherwise
+        for illegal in range(self.max_illegal + 1):
+            start = time.perf_counter()
+            try:
+                from_pos, slide = await seat.move(game, player_idx, self.move_timeout)
+            except asyncio.TimeoutError:
+                return 1 - player_idx, 'timeout'
+            except (ConnectionError, OSError, ProtocolError):
+                return 1 - player_idx, 'disconnect'
+            metrics.observe(f'server.move.{seat.name}', time.perf_counter() - start)
+            # only the 44 moves of the table: the engines do not check the bounds of the coordinates
+            if (tuple(from_pos), slide) in MOVE_IDS and game.qlearning_move(from_pos, slide, player_idx):
+                return -1, ''
+            if illegal < self.max_illegal:
+                try:
+                    await seat.illegal(self.max_illegal - illegal)
+                except (ConnectionError, OSError):
+                    return 1 - player_idx, 'disconnect'
+        return 1 - player_idx, 'illegal'
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''Serves one connection: a match for every hello of the agent'''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                hello = json.loads(line)
+                if not isinstance(hello, dict) or hello.get('type') != 'hello':
+                    raise ProtocolError(f'expected a hello, got {hello}')
+                agent = AgentSeat(reader, writer, str(hello.get('name', 'agent')))
+                opponent = hello.get('opponent')
+                if opponent is not None:
+                    if opponent not in PLAYERS:
+                        await agent.send({'type': 'error', 'message': f'unknown opponent {opponent!r}'})
+                        continue
+                    builtin = BuiltinSeat(opponent, self.executor, self.engine)
+                    seats = [builtin, agent] if hello.get('seat', 0) == 1 else [agent, builtin]
+                    await self.play(*seats)
+                elif self.waiting is None:
+                    # the first agent waits, the match is played by the task of the second one
+                    done = asyncio.get_running_loop().create_future()
+                    self.waiting = (agent, done)
+                    await done
+                else:
+                    (first, done), self.waiting = self.waiting, None
+                    try:
+                        await self.play(first, agent)
+                    finally:
+                        done.set_result(None)
+        except (ConnectionError, OSError, ProtocolError, json.JSONDecodeError):
+            pass
+        finally:
+            if self.waiting is not None and self.waiting[0].writer is writer:
+                self.waiting = None
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, path: str = None) -> None:
+        '''Accepts agents forever, on a Unix socket if path is given, otherwise on TCP host:port'''
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_agent(player: Player, host: str = '127.0.0.1', port: int = 8765, path: str = None, name: str = None,
+                    opponent: str = None, seat: int = 0, matches: int = 1) -> list[dict]:
+    '''Connects a Player of this process to a server as an external agent and plays `matches` matches'''
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    agent = AgentSeat(reader, writer, name or type(player).__name__)
+    hello = {'type': 'hello', 'name': agent.name, 'seat': seat}
+    if opponent is not None:
+        hello['opponent'] = opponent
+    results = []
+    try:
+        for _ in range(matches):
+            await agent.send(hello)
+            while True:
+                message = await agent.receive()
+                if message['type'] == 'turn':
+                    from_pos, slide = player.make_move(ENGINES['game'].from_board(np.array(message['board']),
+                                                                                  message['player']))
+                    await agent.send({'type': 'move', 'from': list(from_pos), 'slide': slide.name})
+                elif message['type'] == 'end':
+                    results.append(message)
+                    break
+                elif message['type'] == 'error':
+                    raise ProtocolError(message['message'])
+    finally:
+        writer.close()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quixo match server for external agents')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='path of a Unix socket to listen on instead of TCP')
+    parser.add_argument('--move-timeout', type=float, default=5.0)
+    parser.add_argument('--max-illegal', type=int, default=100)
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='game')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    server = MatchServer(args.move_timeout, args.max_illegal, engine=args.engine, workers=args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    finally:
+        server.close()
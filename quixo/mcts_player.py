@@ -0,0 +1,197 @@
+import math
+import random
+import time
+from array import array
+import numpy as np
+import metrics
+import batch_rollout
+from game import Game, Move, Player, MOVES
+from bitboard_game import BitboardGame, apply_move
+
+
+class _Tree(object):
+    '''
+    Search tree stored as a structure of arrays: node i is described by the i-th element of every array.
+    The children of a node are created all together, so they are the contiguous block
+    [first_child, first_child + num_children).
+    '''
+    __slots__ = ('parent', 'move', 'player', 'first_child', 'num_children', 'visits', 'wins', 'value')
+
+    def __init__(self) -> None:
+        self.parent = array('i')
+        self.move = array('b')  # id of the move leading to the node, -1 for the root
+        self.player = array('b')  # player who made that move
+        self.first_child = array('i')  # -1 until the node is expanded
+        self.num_children = array('b')
+        self.visits = array('i')
+        self.wins = array('d')  # wins of `player` in the playouts through the node, draws count 1/2
+        self.value = array('d')  # with an evaluator, expected result of `player` given by it (-1 if not evaluated)
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def add(self, parent: int, move: int, player: int) -> int:
+        self.parent.append(parent)
+        self.move.append(move)
+        self.player.append(player)
+        self.first_child.append(-1)
+        self.num_children.append(0)
+        self.visits.append(0)
+        self.wins.append(0.0)
+        self.value.append(-1.0)
+        return len(self.parent) - 1
+
+    def subtree(self, root: int) -> '_Tree':
+        '''Copy of the subtree under `root`, which becomes node 0 of the new tree'''
+        tree = _Tree()
+        tree.add(-1, -1, self.player[root])
+        tree.visits[0], tree.wins[0], tree.value[0] = self.visits[root], self.wins[root], self.value[root]
+        queue = [(root, 0)]
+        while queue:
+            old, new = queue.pop()
+            if self.first_child[old] < 0:
+                continue
+            tree.first_child[new] = len(tree)
+            tree.num_children[new] = self.num_children[old]
+            for child in range(self.first_child[old], self.first_child[old] + self.num_children[old]):
+                idx = tree.add(new, self.move[child], self.player[child])
+                tree.visits[idx], tree.wins[idx], tree.value[idx] = self.visits[child], self.wins[child], self.value[child]
+                queue.append((child, idx))
+        return tree
+
+
+#Monte Carlo Tree Search with the UCT selection rule. The subtree under the chosen move is kept for the next turn,
+#so the playouts already spent on the likely answers of the opponent are not lost.
+#With an evaluator (see evaluator.py) there are no random playouts: the children of an expanded node are scored all
+#together by the evaluator, and a new node counts its score, from 0 (loss) to 1 (win), as the result of a playout.
+class MCTSPlayer(Player):
+    def __init__(self, time_budget: float = 1.0, max_playouts: int = None, exploration: float = 1.4,
+                 max_playout_moves: int = 200, evaluator: 'Evaluator' = None) -> None:
+        super().__init__()
+        self.time_budget = time_budget
+        self.max_playouts = max_playouts
+        self.exploration = exploration
+        self.max_playout_moves = max_playout_moves
+        self.evaluator = evaluator
+        self.tree = None
+        self.root_bits = None  # bitboards of the position after the move chosen in the previous turn
+        self.playouts = 0  # playouts of the last search
+
+    def make_move(self, game: 'Game') -> tuple[tuple[int, int], Move]:
+        sim = BitboardGame.from_board(game.get_board(), game.get_current_player())
+        self.tree = self.reuse_tree(sim)
+
+        start = time.perf_counter()
+        self.playouts = 0
+        # at least one playout, so that the root has its children
+        while self.playouts == 0 or not self.budget_spent(start):
+            self.search(sim)
+            self.playouts += 1
+        metrics.count('mcts.playouts', self.playouts)
+        metrics.gauge('mcts.tree_size', len(self.tree))
+
+        # the most visited child is the move to play, its subtree is kept for the next turn
+        tree = self.tree
+        first = tree.first_child[0]
+        best = max(range(first, first + tree.num_children[0]), key=lambda child: tree.visits[child])
+        sim.push(int(tree.move[best]))
+        self.root_bits = sim._bits
+        self.tree = tree.subtree(best)
+        return MOVES[tree.move[best]]
+
+    def budget_spent(self, start: float) -> bool:
+        if self.max_playouts is not None and self.playouts >= self.max_playouts:
+            return True
+        return self.time_budget is not None and time.perf_counter() - start >= self.time_budget
+
+    def reuse_tree(self, sim: BitboardGame) -> _Tree:
+        # the opponent has moved after our last move: its move is looked for among the children of the kept root
+        tree = self.tree
+        if tree is not None and self.root_bits is not None and tree.first_child[0] >= 0:
+            opponent = 1 - sim.current_player_idx
+            for child in range(tree.first_child[0], tree.first_child[0] + tree.num_children[0]):
+                own, opp = apply_move(tree.move[child], self.root_bits[opponent], self.root_bits[1 - opponent])
+                bits = (own, opp) if opponent == 0 else (opp, own)
+                if bits == sim._bits:
+                    return tree.subtree(child)
+        tree = _Tree()
+        tree.add(-1, -1, 1 - sim.current_player_idx)
+        return tree
+
+    def search(self, sim: BitboardGame) -> None:
+        '''One iteration: selection, expansion, playout (or evaluation) and backpropagation'''
+        tree = self.tree
+        node = 0
+        depth = 0
+        winner = sim.check_winner()
+        # selection: descend through the expanded nodes with the UCT rule
+        while tree.first_child[node] >= 0 and winner < 0:
+            node = self.select(node)
+            sim.push(int(tree.move[node]))
+            depth += 1
+            winner = sim.check_winner()
+        # expansion: all the children of a leaf already visited are created, then the first one is played
+        if winner < 0 and (tree.visits[node] > 0 or node == 0):
+            move_ids = list(sim.iter_move_ids(sim.current_player_idx))
+            random.shuffle(move_ids)
+            tree.first_child[node] = len(tree)
+            tree.num_children[node] = len(move_ids)
+            for move_id in move_ids:
+                tree.add(node, move_id, sim.current_player_idx)
+            if self.evaluator is not None:
+                self.evaluate_children(sim, node)
+            node = tree.first_child[node]
+            sim.push(int(tree.move[node]))
+            depth += 1
+            winner = sim.check_winner()
+        # result of the leaf for the player who moved to it, from 0 (loss) to 1 (win)
+        playout_moves = 0
+        if winner >= 0:
+            result = 1.0 if winner == tree.player[node] else 0.0
+        elif self.evaluator is not None:
+            result = tree.value[node]
+        else:
+            # playout: random moves until the end of the game
+            while winner < 0 and playout_moves < self.max_playout_moves:
+                sim.push(random.choice(list(sim.iter_move_ids(sim.current_player_idx))))
+                playout_moves += 1
+                winner = sim.check_winner()
+            result = 0.5 if winner == -1 else float(winner == tree.player[node])
+        for _ in range(depth + playout_moves):
+            sim.pop()
+        # backpropagation
+        leaf_player = tree.player[node]
+        while node >= 0:
+            tree.visits[node] += 1
+            tree.wins[node] += result if tree.player[node] == leaf_player else 1.0 - result
+            node = tree.parent[node]
+
+    def evaluate_children(self, sim: BitboardGame, node: int) -> None:
+        # the positions after the moves of the children, scored in one call of the evaluator (the ones ending the
+        # game by their result): value of a child is the expected result of the player who made its move
+        tree = self.tree
+        first, count = tree.first_child[node], tree.num_children[node]
+        player = sim.current_player_idx
+        boards = batch_rollout.apply_moves(np.repeat(sim.get_board().reshape(1, 25).astype(np.int8), count, axis=0),
+                                           np.array(tree.move[first:first + count], dtype=np.intp),
+                                           np.full(count, player, dtype=np.int8))
+        winners = batch_rollout.winners(boards)
+        # the evaluator gives the value for the opponent, who is to move after the move
+        values = (1.0 - self.evaluator.evaluate(boards, np.full(count, 1 - player))) / 2
+        values = np.where(winners == player, 1.0, np.where(winners >= 0, 0.0, values))
+        for idx, value in enumerate(values.tolist()):
+            tree.value[first + idx] = value
+
+    def select(self, node: int) -> int:
+        # child maximizing wins / visits + c * sqrt(ln(parent visits) / visits), unvisited children first
+        tree = self.tree
+        log_visits = math.log(max(1, tree.visits[node]))
+        best, best_value = -1, -1.0
+        for child in range(tree.first_child[node], tree.first_child[node] + tree.num_children[node]):
+            visits = tree.visits[child]
+            if visits == 0:
+                return child
+            value = tree.wins[child] / visits + self.exploration * math.sqrt(log_visits / visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
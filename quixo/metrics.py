@@ -0,0 +1,137 @@
+import json
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# In-process registry of counters, gauges and timers for the engines, the players and the trainers.
+# Updating a counter is a dictionary increment, so the instrumentation stays on; metrics.disable() turns it off.
+# A timer keeps count, total and maximum of its durations and a uniform sample of at most SAMPLE_SIZE of them
+# (reservoir sampling, with its own random generator so that seeded games are not affected) for the percentiles.
+# Counters are named '<component>.<event>', e.g. 'game.check_winner', 'rollout.playouts', 'qtable.hits'.
+
+SAMPLE_SIZE = 1024
+PERCENTILES = (50, 90, 99)
+
+
+class _Timer(object):
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+
+class Registry(object):
+    '''Counters, gauges and timers of a process. dump() writes them as JSON lines'''
+
+    def __init__(self) -> None:
+        self.enabled = True
+        self._rng = random.Random(0)
+        self.reset()
+
+    def reset(self) -> None:
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.timers = defaultdict(_Timer)
+        self.start = time.perf_counter()
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += n
+
+    def gauge(self, name: str, value: float) -> None:
+        if self.enabled:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        '''Adds a duration to the timer'''
+        if not self.enabled:
+            return
+        timer = self.timers[name]
+        timer.count += 1
+        timer.total += seconds
+        timer.max = max(timer.max, seconds)
+        if len(timer.samples) < SAMPLE_SIZE:
+            timer.samples.append(seconds)
+        else:
+            idx = self._rng.randrange(timer.count)
+            if idx < SAMPLE_SIZE:
+                timer.samples[idx] = seconds
+
+    @contextmanager
+    def timer(self, name: str):
+        '''Times the body of a with statement'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def state(self) -> dict:
+        '''Raw content of the registry, picklable, to be merged in the registry of another process'''
+        return {
+            'elapsed': time.perf_counter() - self.start,
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'timers': {name: (t.count, t.total, t.max, list(t.samples)) for name, t in self.timers.items()},
+        }
+
+    def merge(self, state: dict) -> None:
+        '''Adds the counters and timers of state (see state()) to the registry, its gauges replace the ones here'''
+        for name, value in state['counters'].items():
+            self.counters[name] += value
+        self.gauges.update(state['gauges'])
+        for name, (count, total, maximum, samples) in state['timers'].items():
+            timer = self.timers[name]
+            # the merged sample keeps the proportion of the two timers
+            if timer.count + count:
+                keep = round(SAMPLE_SIZE * timer.count / (timer.count + count))
+                own = self._rng.sample(timer.samples, min(keep, len(timer.samples)))
+                other = self._rng.sample(samples, min(SAMPLE_SIZE - len(own), len(samples)))
+                timer.samples = own + other
+            timer.count += count
+            timer.total += total
+            timer.max = max(timer.max, maximum)
+
+    def summary(self) -> list[dict]:
+        '''One record per metric: counters with their rate per second since the reset, gauges, timer statistics'''
+        elapsed = time.perf_counter() - self.start
+        records = []
+        for name, value in sorted(self.counters.items()):
+            records.append({'metric': name, 'type': 'counter', 'value': value, 'rate': value / elapsed})
+        for name, value in sorted(self.gauges.items()):
+            records.append({'metric': name, 'type': 'gauge', 'value': value})
+        for name, timer in sorted(self.timers.items()):
+            record = {'metric': name, 'type': 'timer', 'count': timer.count, 'total': timer.total,
+                      'mean': timer.total / max(1, timer.count), 'max': timer.max}
+            samples = sorted(timer.samples)
+            for percentile in PERCENTILES:
+                record[f'p{percentile}'] = samples[min(len(samples) - 1, len(samples) * percentile // 100)] if samples else 0.0
+            records.append(record)
+        return records
+
+    def dump(self, file, **labels) -> None:
+        '''Appends the summary to an open text file as JSON lines, with a timestamp and the given labels'''
+        now = time.time()
+        for record in self.summary():
+            file.write(json.dumps({'time': now, **labels, **record}) + '\n')
+        file.flush()
+
+
+# registry of the process, used by the module functions below
+REGISTRY = Registry()
+count = REGISTRY.count
+gauge = REGISTRY.gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+
+def enable() -> None:
+    REGISTRY.enabled = True
+
+
+def disable() -> None:
+    REGISTRY.enabled = False
@@ -1,70 +1,216 @@
-from copy import deepcopy
-from game import Game, Move, Player
+import time
+from game import Game, Move, Player, MOVES
+from transposition_table import TranspositionTable, EXACT, LOWER, UPPER
+from solver import Solver, WIN, UNKNOWN
 import numpy as np
 
+
+class SearchTimeout(Exception):
+    '''Raised inside the search when the deadline of the move has passed'''
+    pass
+
+
 class MinMaxPlayer(Player):
-    def __init__(self, player: int = 0) -> None:
+    def __init__(self, player: int = 0, max_depth: int = 4, tt_size_bits: int = 18, time_limit: float = 0.1,
+                 heuristic: bool = True, solver: Solver = None, evaluator: 'Evaluator' = None) -> None:
         super().__init__()
         player = player % 2
         self.player = player
+        self.max_depth = max_depth  # deepest iteration of the iterative deepening
+        self.time_limit = time_limit  # seconds per move, None to always reach max_depth
+        self.heuristic = heuristic  # evaluate the positions at the horizon by the partial lines of the players
+        # positions already searched, kept across moves: the values are from the point of view of self.player
+        self.tt = TranspositionTable(tt_size_bits)
+        self.search_depth = max_depth
+        self.deadline = None
+        # move ordering: two killer moves per ply, history score per player and move id
+        self.killers = [[-1, -1] for _ in range(max_depth + 2)]
+        self.history = [[0] * len(MOVES) for _ in range(2)]
+        self.completed_depth = 0  # depth of the last completed iteration
+        self.solver = solver
+        self.solved = {}  # Zobrist key -> value of the database for the positions looked up in the search, None if unsolved
+        # learned evaluation (see evaluator.py): the positions at the horizon are scored by it, all the children of a
+        # node in one batch, instead of the heuristic
+        self.evaluator = evaluator
 
     def make_move(self, game: 'Game') -> tuple[tuple[int, int], Move]:
-        temp = deepcopy(game)
-         #get the best move to choose using Minimax
-        move = self.minmax(temp)
+        #a forced win found by the solver (or already in its database) is played without searching
+        if self.solver is not None:
+            result, _, move = self.solver.solve(game)
+            if result == WIN:
+                return move
+        #get the best move to choose using Minimax. The search undoes every move it makes, so it can work on the game itself
+        move = self.iterative_deepening(game)
         pos = (move[0], move[1])
         slide = move[2]
         return pos, slide
 
+    #Searches at depth 1, 2, ... max_depth and keeps the result of the last completed iteration. Every iteration
+    #fills the transposition table, whose best moves make the next one much faster. Once the deadline has passed the
+    #running iteration is abandoned, so the time per move is bounded by time_limit (the first iteration always completes).
+    def iterative_deepening(self, game: 'Game') -> list:
+        self.tt.new_search()
+        self.solved = {}  # the database may have grown since the last move
+        self.killers = [[-1, -1] for _ in range(self.max_depth + 2)]
+        self.history = [[value // 2 for value in history] for history in self.history]  # aging
+        start = time.perf_counter()
+        best = None
+        for depth in range(1, self.max_depth + 1):
+            self.search_depth = depth
+            self.deadline = start + self.time_limit if self.time_limit is not None and depth > 1 else None
+            try:
+                result = self.minmax(game)
+            except SearchTimeout:
+                break
+            best = result
+            self.completed_depth = depth
+            if abs(best[3]) >= 1:  # a forced win or loss, deeper searches can not change it
+                break
+        self.deadline = None
+        return best
+
     #The function also performs alpha-beta pruning to avoid exploring branches that would not influence the best choice.
     #Alpha represents the best-known value for the MAX player. Beta represents the best-known value for the MIN player.
     #Pruning occurs when the MAX (or MIN) player finds a move that is already better than what the opponent (MIN or MAX) could achieve.
+    #Quixo reaches the same position through many move orders, so every searched position is stored in the transposition table.
     def minmax(self, game: 'Game', depth: int = 1, alpha = -np.inf, beta = np.inf) -> tuple[tuple[int, int], Move]:
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
         player_id = game.current_player_idx
-        possible_moves = game.available_moves(player_id)
-        max_pruning = 2 #more is slow and don't give big improvements. Playing for Max
+        remaining = self.search_depth - depth + 1  # plies still to search under this position
 
-        # Initialize the best scores for the current move (both MAX player and MIN player)
-        best_score_info = [-1, -1, -1, -np.inf] if player_id == self.player else [-1, -1, -1, +np.inf]
+        # If the game is over or the maximum depth level has been reached.
+        if game.check_winner() != -1 or remaining <= 0:
+            return [-1, -1, -1, self.evaluate(game)]
 
-        # If there are no available moves or the maximum depth level has been reached.
-        if game.check_winner() != -1 or depth > max_pruning or not possible_moves:
-            return [-1, -1, -1, self.calculate_score(game)]
+        # A position already searched at least as deep gives its value, or a bound that may be enough for a cutoff
+        key = game.zobrist_key()
+        entry = self.tt.probe(key)
+        tt_move = -1
+        if entry is not None:
+            tt_depth, flag, value, tt_move = entry
+            if tt_depth >= remaining and (flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha)):
+                (x, y), slide = MOVES[tt_move]
+                return [x, y, slide, value]
+        # A position solved by the endgame solver has its value without any search. The database is only read on a
+        # miss of the table, and once per position of the search (it canonicalizes the board and may query SQLite)
+        elif self.solver is not None and depth > 1 and remaining >= 2:
+            if key not in self.solved:
+                self.solved[key] = self.solved_value(game, player_id)
+            if self.solved[key] is not None:
+                return [-1, -1, -1, self.solved[key]]
 
-        for move in possible_moves:
-            position, slide = move
-            # Save the board state before making the move and going into recursion
-            temp_board_state = deepcopy(game._board[position[1], :]) if slide in {Move.LEFT, Move.RIGHT} else deepcopy(game._board[:, position[0]])
+        possible_moves = self.order_moves(list(game.iter_move_ids(player_id)), tt_move, depth, player_id)
+        # If there are no available moves
+        if not possible_moves:
+            return [-1, -1, -1, self.evaluate(game)]
 
-            # Execute the move and recursively calculate the score.  
-            game.my_move(position, slide, player_id)
-            reward = self.minmax(game, depth + 1, alpha, beta)
+        # Last ply before the horizon: the children are evaluated together, without recursion (nor cutoffs)
+        if self.evaluator is not None and remaining == 1:
+            best_score_info, best_move = self.evaluate_children(game, possible_moves, player_id)
+            self.tt.store(key, remaining, EXACT, best_score_info[3], best_move)
+            return best_score_info
 
-            # restore the value
-            if slide == Move.LEFT or slide == Move.RIGHT:
-                game._board[position[1]] = temp_board_state
-            else:
-                game._board[:, position[0]] = temp_board_state
+        # Initialize the best scores for the current move (both MAX player and MIN player)
+        best_score_info = [-1, -1, -1, -np.inf] if player_id == self.player else [-1, -1, -1, +np.inf]
+        best_move = -1
+        alpha_start, beta_start = alpha, beta
+
+        for move_id in possible_moves:
+            # Execute the move and recursively calculate the score, then undo it (also when the search times out)
+            game.push(move_id, player_id)
+            try:
+                reward = self.minmax(game, depth + 1, alpha, beta)
+            finally:
+                game.pop()
 
-            reward[0] = position[0]  # x
-            reward[1] = position[1]  # y
+            (x, y), slide = MOVES[move_id]
+            reward[0] = x
+            reward[1] = y
             reward[2] = slide
 
             #MinMaxPlayer plays for Max
-            if player_id == self.player:  
+            if player_id == self.player:
                 if reward[3] > best_score_info[3]:
                     best_score_info = reward  # Update for Max player
-                    alpha = reward[3]
+                    best_move = move_id
+                alpha = max(alpha, reward[3])
             else:
                 if reward[3] < best_score_info[3]:
                     best_score_info = reward  # Update for Min player
-                    beta = reward[3]
+                    best_move = move_id
+                beta = min(beta, reward[3])
 
             if alpha >= beta:  # without the = more efficient but slower. You prune more the tree
+                # remember the move that caused the cutoff, it is tried early in the sibling positions
+                if move_id != self.killers[depth][0]:
+                    self.killers[depth][1] = self.killers[depth][0]
+                    self.killers[depth][0] = move_id
+                self.history[player_id][move_id] += remaining * remaining
                 break
 
+        # The value is exact only if it fell inside the window the position was searched with
+        if best_score_info[3] <= alpha_start:
+            flag = UPPER
+        elif best_score_info[3] >= beta_start:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, remaining, flag, best_score_info[3], best_move)
         return best_score_info
 
+    def solved_value(self, game: 'Game', player_id: int):
+        # value for self.player of a position proven by the solver, None if the database does not solve it
+        solution = self.solver.db.get(game)
+        if solution is None or solution[0] == UNKNOWN:
+            return None
+        return 1 if (solution[0] == WIN) == (player_id == self.player) else -1
+
+    def order_moves(self, move_ids: list, tt_move: int, depth: int, player_id: int) -> list:
+        # principal variation move (best move stored in the table) first, then the killer moves of the ply,
+        # then the others by history score
+        history = self.history[player_id]
+        move_ids.sort(key=lambda move_id: history[move_id], reverse=True)
+        for move_id in reversed([tt_move] + self.killers[depth]):
+            if move_id >= 0 and move_id in move_ids:
+                move_ids.remove(move_id)
+                move_ids.insert(0, move_id)
+        return move_ids
+
+    def evaluate_children(self, game: 'Game', move_ids: list, player_id: int) -> tuple[list, int]:
+        # best move of player_id and its score: the games ended by a move score -1/0/1, the other positions are
+        # scored by the evaluator in one call, in (-0.9, 0.9) as the heuristic
+        scores, boards, pending = [], [], []
+        for idx, move_id in enumerate(move_ids):
+            game.push(move_id, player_id)
+            if game.check_winner() != -1:
+                scores.append(self.calculate_score(game))
+            else:
+                scores.append(0.0)
+                boards.append(game.get_board())
+                pending.append(idx)
+            game.pop()
+        if boards:
+            # values for the player to move after the moves, the opponent of player_id
+            values = self.evaluator.evaluate(np.array(boards), np.full(len(boards), 1 - player_id))
+            sign = 0.9 if 1 - player_id == self.player else -0.9
+            for idx, value in zip(pending, values):
+                scores[idx] = sign * float(value)
+        best = int(np.argmax(scores)) if player_id == self.player else int(np.argmin(scores))
+        (x, y), slide = MOVES[move_ids[best]]
+        return [x, y, slide, scores[best]], move_ids[best]
+
+    def evaluate(self, game: 'Game') -> float:
+        # terminal positions score -1/0/1. The others, with the heuristic, score in (-0.9, 0.9): every line still
+        # open for only one of the players counts the square of the pieces that player has on it
+        score = self.calculate_score(game)
+        if score != 0 or not self.heuristic or game.check_winner() != -1:
+            return score
+        counts = game.line_counts()
+        own, other = counts[self.player], counts[1 - self.player]
+        value = int(((own * own) * (other == 0)).sum() - ((other * other) * (own == 0)).sum())
+        return 0.9 * value / (12 * 16)
+
     def calculate_score(self, game: 'Game') -> int:
         winner = game.check_winner()
         if winner == self.player:
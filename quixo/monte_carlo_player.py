@@ -1,41 +1,53 @@
 import random
 from game import Game, Move, Player
-from copy import deepcopy, copy
+import numpy as np
+import batch_rollout
+import metrics
+from parallel_search import ParallelSearch
 
 #the player uses Monte Carlo simulation technique to make decisions about its moves
 class MonteCarloPlayer(Player):
-    def __init__(self) -> None:
+    # with batched=True all the simulations of a candidate move run in lockstep with batch_rollout,
+    # so num_simulations can be raised to thousands. With parallel='root' or 'leaf' the candidate moves are
+    # scored on a pool of processes kept alive across moves, for time_budget seconds per move instead of num_simulations
+    def __init__(self, num_simulations: int = 500, num_selected_moves: int = 40, batched: bool = False,
+                 parallel: str = None, time_budget: float = 1.0, workers: int = None) -> None:
         super().__init__()
+        self.num_simulations = num_simulations
+        self.num_selected_moves = num_selected_moves
+        self.batched = batched
+        self.time_budget = time_budget
+        self.search = ParallelSearch(parallel, workers, 'random') if parallel else None
+        self.rng = np.random.default_rng(random.getrandbits(64))  # seeded by random, for reproducible games
+
+    def close(self) -> None:
+        # the pool of the parallel search is not needed anymore
+        if self.search is not None:
+            self.search.close()
 
     def make_move(self, game: 'Game') -> tuple[tuple[int, int], Move]:
         
         return self.monte_carlo_move(game)
 
     def monte_carlo_move(self, game: 'Game') -> tuple[tuple[int, int], Move]:
-        num_simulations = 500  # Number of Monte Carlo simulations to perform
-        num_selected_moves = min(len(game.available_moves(game.get_current_player())), 40)
+        num_simulations = self.num_simulations  # Number of simulations to perform
+        num_selected_moves = min(len(game.available_moves(game.get_current_player())), self.num_selected_moves)
         best_move = None
         best_score = float('-inf')
 
+        if self.search is not None:
+            # Score the selected moves in parallel, the best mean score wins since the moves get different numbers of playouts
+            moves = random.sample(game.available_moves(game.get_current_player()), num_selected_moves)
+            scores = self.search.score_moves(game, moves, self.time_budget, self.rng)
+            return max(zip(moves, scores), key=lambda item: item[1][0] / item[1][1])[0]
+
         # Iterate over a randomly selected subset of available moves
         for move in random.sample(game.available_moves(game.get_current_player()), num_selected_moves):
-            total_score = 0
             # Simulate multiple games to evaluate the potential outcomes of the current move
-            for _ in range(num_simulations):
-                cloned_game = copy(game)
-                cloned_game.my_move(move[0], move[1], game.get_current_player())
-
-                # Simulate the game until there is a winner
-                while cloned_game.check_winner() == -1:
-                    # Consider only a subset of randomly available moves in each simulation
-                    random_move = random.choice(cloned_game.available_moves(cloned_game.get_current_player()))
-                    cloned_game.my_move(random_move[0], random_move[1], cloned_game.get_current_player())
-
-                # Update the total score based on the outcome of the simulation
-                if cloned_game.check_winner() == 0:
-                    total_score += 1
-                elif cloned_game.check_winner() == 1:
-                    total_score -= 1
+            if self.batched:
+                total_score = batch_rollout.score_move(game, move, num_simulations, self.rng, 'random')
+            else:
+                total_score = self.simulate(game, move, num_simulations)
 
             # Update the best move based on the total score
             if total_score > best_score:
@@ -44,3 +56,31 @@ class MonteCarloPlayer(Player):
 
         return best_move
 
+    def simulate(self, game: 'Game', move: tuple[tuple[int, int], Move], num_simulations: int) -> int:
+        # Play the simulations one at a time: +1 for every win of the player to move, -1 for every loss
+        player = game.get_current_player()
+        total_score = 0
+        metrics.count('simulate.playouts', num_simulations)
+        for _ in range(num_simulations):
+            # Play the simulation on the game itself and undo all its moves at the end
+            game.push(move)
+            num_moves = 1
+
+            # Simulate the game until there is a winner
+            while game.check_winner() == -1:
+                # Consider only a subset of randomly available moves in each simulation
+                random_move = random.choice(game.available_moves(game.get_current_player()))
+                game.push(random_move)
+                num_moves += 1
+
+            # Update the total score based on the outcome of the simulation
+            winner = game.check_winner()
+            if winner == player:
+                total_score += 1
+            elif winner == 1 - player:
+                total_score -= 1
+
+            for _ in range(num_moves):
+                game.pop()
+
+        return total_score
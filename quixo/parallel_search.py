@@ -0,0 +1,108 @@
+import os
+import time
+from multiprocessing import Pool, current_process
+import numpy as np
+import batch_rollout
+from game import MOVE_IDS
+
+# Parallel Monte Carlo scoring of the candidate moves, on a pool of processes that stays alive across moves.
+# - root parallel: the candidate moves are split among the workers, each one plays batches of playouts
+#   of its own moves until the deadline
+# - leaf parallel: the playouts of all the candidates are cut into small batches, which are handed out
+#   to the workers round-robin until the deadline
+# The deadline is a time.time() value, so that it means the same in every process.
+# A daemonic process (e.g. a worker of the tournament pool) can not start processes of its own: there the moves are
+# scored in the process itself, all of them by one root parallel task.
+
+
+def _score_until(task: tuple) -> list[tuple[int, int]]:
+    # root parallel task: batches of playouts of its share of the moves, round-robin until the deadline
+    board, player, move_ids, deadline, batch_size, policy, seed = task
+    rng = np.random.default_rng(seed)
+    results = [[0, 0] for _ in move_ids]
+    idx = 0
+    while idx < len(move_ids) or time.time() < deadline:
+        result = results[idx % len(move_ids)]
+        result[0] += batch_rollout.score_board(board, player, move_ids[idx % len(move_ids)], batch_size, rng, policy)
+        result[1] += batch_size
+        idx += 1
+    return [tuple(result) for result in results]
+
+
+def _score_batch(task: tuple) -> tuple[int, int]:
+    # leaf parallel task: one batch of playouts
+    board, player, move_id, batch_size, policy, seed = task
+    rng = np.random.default_rng(seed)
+    return batch_rollout.score_board(board, player, move_id, batch_size, rng, policy), batch_size
+
+
+class ParallelSearch(object):
+    '''
+    Scores candidate moves with playouts on a persistent pool of `workers` processes.
+    mode is 'root' or 'leaf', policy is the playout policy of batch_rollout ('random' or 'greedy').
+    '''
+
+    def __init__(self, mode: str = 'root', workers: int = None, policy: str = 'random', batch_size: int = 64) -> None:
+        if mode not in ('root', 'leaf'):
+            raise ValueError(f"unknown parallel mode {mode!r}, use 'root' or 'leaf'")
+        self.mode = mode
+        self.workers = workers
+        self.policy = policy
+        self.batch_size = batch_size
+        self._pool = None
+
+    def pool(self) -> Pool:
+        # created at the first search and reused for all the following moves
+        if self._pool is None:
+            self._pool = Pool(self.workers)
+        return self._pool
+
+    def close(self) -> None:
+        '''Terminates the pool, a new one is created by the next search'''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def __enter__(self) -> 'ParallelSearch':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def score_moves(self, game, moves: list, time_budget: float, rng: np.random.Generator) -> list[tuple[int, int]]:
+        '''Scores the moves of the current player of `game` within time_budget seconds. Returns (score, playouts) for each move'''
+        deadline = time.time() + time_budget
+        board = np.asarray(game.get_board(), dtype=np.int8)
+        player = game.get_current_player()
+        move_ids = [MOVE_IDS[(tuple(move[0]), move[1])] for move in moves]
+        if current_process().daemon:
+            return _score_until((board, player, move_ids, deadline, self.batch_size, self.policy,
+                                 int(rng.integers(2 ** 63))))
+        workers = self.workers or os.cpu_count()
+        if self.mode == 'root':
+            # move i goes to worker i % workers
+            shares = [move_ids[w::workers] for w in range(min(workers, len(move_ids)))]
+            tasks = [(board, player, share, deadline, self.batch_size, self.policy, int(rng.integers(2 ** 63)))
+                     for share in shares]
+            scores = self.pool().map(_score_until, tasks)
+            return [scores[i % len(shares)][i // len(shares)] for i in range(len(move_ids))]
+
+        results = [[0, 0] for _ in move_ids]
+        pending = []
+        next_move = 0
+        # keep two batches per worker in flight, so that no worker waits for the next task
+        in_flight = 2 * workers
+        while True:
+            now = time.time()
+            while len(pending) < in_flight and (now < deadline or next_move < len(move_ids)):
+                idx = next_move % len(move_ids)
+                task = (board, player, move_ids[idx], self.batch_size, self.policy, int(rng.integers(2 ** 63)))
+                pending.append((idx, self.pool().apply_async(_score_batch, (task,))))
+                next_move += 1
+            if not pending:
+                break
+            idx, result = pending.pop(0)
+            score, playouts = result.get()
+            results[idx][0] += score
+            results[idx][1] += playouts
+        return [tuple(result) for result in results]
@@ -1,16 +1,18 @@
 import numpy as np
 from tqdm import tqdm
-from game import Game, Move
+from game import Game, MOVE_IDS
 import random
-import sys
-import struct
+from symmetry import canonicalize, MOVE_MAPS
+from q_table_file import pack_board
+from q_store import QStore, best_action
 
 class QLearning:
     def __init__(self, alpha, gamma, epsilon, player):
         self.learning_rate = alpha
         self.discount_factor = gamma
         self.exploration_rate = epsilon
-        self.q_table = {}
+        # packed canonical board -> row of 44 Q-values, one per move id (see q_store.py)
+        self.q_table = QStore()
         self.player = player
 
     def set_exploration_rate(self, epsilon):
@@ -23,21 +25,18 @@ class QLearning:
         return self.q_table
 
     def get_q_value(self, state, action):
-        # Get Q-value from the Q-table
-        if (state, action) not in self.q_table:
-            self.q_table[(state, action)] = 0
-        return self.q_table[(state, action)]
+        # Get Q-value from the Q-table, 0 if not present (nothing is added to the table)
+        return self.q_table.get(state, action)
 
     def choose_action(self, state, actions):
         # Choose an action based on the exploration rate
         if np.random.uniform() < self.exploration_rate:
             return actions[np.random.choice(range(len(actions)))]
         else:
-            state = self.compact_string(state)
-            actions = [self.compact_move(action) for action in actions]
-            q_values = np.array([self.get_q_value(state, action) for action in actions])
-            maximum = np.max(q_values)
-            return self.decode_move(actions[np.random.choice(np.where(q_values == maximum)[0])])
+            # Look up the row of the canonical board and the images of the actions on it, but return the original action
+            state, symmetry = canonicalize(state)
+            action_ids = MOVE_MAPS[symmetry, [MOVE_IDS[action] for action in actions]]
+            return actions[best_action(self.q_table.row(pack_board(state)), action_ids)]
 
     def calculate_reward(self, win):
         # Calculate the reward based on the game result
@@ -47,33 +46,35 @@ class QLearning:
             return -1
         else:
             return 0
-        
-    def compact_string(self, matrix):
-        # Flatten and compress the matrix into a string. Used because the key of the map couldn't be a tup
-        matrix = matrix.flatten()
-        compressed_data = struct.pack(f">{len(matrix)}b", *matrix)
-        return compressed_data
-
-    def compact_move(self, t):
-        # Convert a tuple to a compacted string
-        string = f"{t[0][0]}{t[0][1]}{t[1].value}"
-        string = string.encode('utf-8')
-        return string
-
-    def decode_move(self, t):
-        # Decode the compacted string to a tuple
-        t = t.decode('utf-8')
-        return (int(t[0]), int(t[1])), Move(int(t[2]))
+
+    def encode(self, state, action):
+        # Packed canonical board and move id of the action on it: the 8 symmetric images of a position share the same entries
+        state, symmetry = canonicalize(state)
+        return pack_board(state), int(MOVE_MAPS[symmetry, MOVE_IDS[action]])
 
     def update_q_values(self, trajectory, reward):
         # Update Q-values using the Bellman equation
-        for state, action in trajectory:
-            state = self.compact_string(state)
-            action = self.compact_move(action)
-            self.q_table[(state, action)] = self.get_q_value(state, action) + \
-                self.learning_rate * (reward - self.get_q_value(state, action))
+        states, actions = zip(*[self.encode(state, action) for state, action in trajectory]) if trajectory else ((), ())
+        self.update_encoded(states, actions, reward)
+
+    def update_encoded(self, states, actions, reward):
+        # Same update on a trajectory already encoded, as the trainer workers send it: the reward is discounted
+        # at every step, and the rows are looked up once per state
+        for state, action in zip(states, actions):
+            row = self.q_table.insert(int(state))
+            values = self.q_table.values  # read after insert, which may replace it with a larger matrix
+            values[row, action] += self.learning_rate * (reward - values[row, action])
             reward = reward * self.discount_factor
 
+    def update_batch(self, episodes):
+        # Applies a batch of encoded episodes (states, actions, reward) in order
+        for states, actions, reward in episodes:
+            self.update_encoded(states, actions, reward)
+
+    def save_q_table(self, filename):
+        # Write the Q-table in the binary format of q_table_file: packed board, move id and float32 value
+        self.q_table.save(filename)
+
 if __name__ == '__main__':
     # Initialize Q-learning agent
     q_agent = QLearning(0.5, 0.85, 1, 1)
@@ -108,8 +109,5 @@ if __name__ == '__main__':
         q_agent.update_q_values(current_trajectory, q_agent.calculate_reward(current_game.check_winner()))
         current_trajectory = []
 
-    # Save the Q-table to a file
-    with open('Q_table_1.txt', 'w') as file:
-        sys.stdout = file
-        for key, value in q_agent.get_q_table().items():
-            print(key[0], key[1], value)  
\ No newline at end of file
+    # Save the Q-table to a binary file, QLearningPlayer maps it in memory
+    q_agent.save_q_table('Q_table_1.bin')  
\ No newline at end of file
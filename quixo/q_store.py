@@ -0,0 +1,118 @@
+import numpy as np
+import metrics
+from game import MOVES
+from q_table_file import QTableFile, write_q_table
+
+# In-memory Q-table of the trainer. The states are packed boards (see q_table_file.pack_board), each one owns a
+# row of a contiguous float32 matrix [states, 44 move ids]. An open-addressing hash table (linear probing, Fibonacci
+# hashing of the packed board) maps a state to its row; both grow by doubling when they are full.
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+_MAX_LOAD = 0.5  # the hash table is doubled when more than half of its slots are used
+
+
+def best_action(row: np.ndarray, action_ids, rng=np.random) -> int:
+    '''Index in action_ids of the action with the highest Q-value in the row, ties broken at random'''
+    q_values = row[action_ids]
+    return int(rng.choice(np.flatnonzero(q_values == q_values.max())))
+
+
+class QStore(object):
+    '''
+    Q-values of (packed state, move id). Reads (get, row, lookup) never insert: a state that was never updated
+    reads as `default` for every action. Rows are created only by update.
+    '''
+
+    def __init__(self, capacity_bits: int = 16, default: float = 0.0) -> None:
+        self.default = default
+        self.size_bits = capacity_bits + 1
+        self.keys = np.full(1 << self.size_bits, -1, dtype=np.int64)  # packed board in the slot, -1 if empty
+        self.slots = np.zeros(1 << self.size_bits, dtype=np.int32)  # row of the state in the slot
+        self.values = np.full((1 << capacity_bits, len(MOVES)), default, dtype=np.float32)
+        self.states = np.zeros(1 << capacity_bits, dtype=np.int64)  # packed board of every row
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _slot(self, state: int) -> int:
+        # first slot of the state, the next ones are tried in order until the state or an empty slot is found
+        slot = ((state * _GOLDEN) & _MASK64) >> (64 - self.size_bits)
+        mask = (1 << self.size_bits) - 1
+        keys = self.keys
+        while keys[slot] != state and keys[slot] != -1:
+            slot = (slot + 1) & mask
+        return slot
+
+    def lookup(self, state: int) -> int:
+        '''Row of the state, -1 if it is not in the table (nothing is inserted)'''
+        metrics.count('qtable.lookups')
+        slot = self._slot(state)
+        if self.keys[slot] == -1:
+            return -1
+        metrics.count('qtable.hits')
+        return int(self.slots[slot])
+
+    def get(self, state: int, action: int) -> float:
+        row = self.lookup(state)
+        return self.default if row < 0 else float(self.values[row, action])
+
+    def row(self, state: int) -> np.ndarray:
+        '''Q-values of all the move ids in the state (a view of the stored row, or a row of defaults)'''
+        row = self.lookup(state)
+        if row < 0:
+            return np.full(len(MOVES), self.default, dtype=np.float32)
+        return self.values[row]
+
+    def insert(self, state: int) -> int:
+        '''Row of the state, created with default values if it is not in the table'''
+        slot = self._slot(state)
+        if self.keys[slot] != -1:
+            return int(self.slots[slot])
+        if self.count == len(self.values):
+            self.values = np.concatenate([self.values, np.full_like(self.values, self.default)])
+            self.states = np.concatenate([self.states, np.zeros_like(self.states)])
+        if self.count + 1 > _MAX_LOAD * len(self.keys):
+            self._rehash()
+            slot = self._slot(state)
+        row = self.count
+        self.keys[slot] = state
+        self.slots[slot] = row
+        self.states[row] = state
+        self.count += 1
+        metrics.gauge('qtable.size', self.count)
+        return row
+
+    def _rehash(self) -> None:
+        # doubles the hash table and inserts again the states of all the rows
+        self.size_bits += 1
+        self.keys = np.full(1 << self.size_bits, -1, dtype=np.int64)
+        self.slots = np.zeros(1 << self.size_bits, dtype=np.int32)
+        for row in range(self.count):
+            slot = self._slot(int(self.states[row]))
+            self.keys[slot] = self.states[row]
+            self.slots[slot] = row
+
+    def update(self, state: int, action: int, value: float) -> None:
+        row = self.insert(state)  # before reading self.values, which insert may replace with a larger matrix
+        self.values[row, action] = value
+
+    def save(self, filename: str) -> None:
+        '''Writes the entries different from the default in the format of q_table_file'''
+        rows, actions = np.nonzero(self.values[:self.count] != self.default)
+        write_q_table(filename, self.states[rows], actions, self.values[rows, actions])
+
+    @classmethod
+    def load(cls, filename: str, default: float = 0.0) -> 'QStore':
+        '''Q-store with the entries of a file written by save (or by q_table_file.write_q_table)'''
+        table = QTableFile(filename, default)
+        states = (table.keys >> np.uint64(8)).astype(np.int64)
+        actions = (table.keys & np.uint64(0xFF)).astype(np.int64)
+        unique, rows = np.unique(states, return_inverse=True)
+        store = cls(max(4, int(len(unique)).bit_length()), default)
+        for state in unique:
+            store.insert(int(state))
+        # the states were inserted in sorted order, so the row of each entry is its index in unique
+        store.values[rows, actions] = table.values
+        return store
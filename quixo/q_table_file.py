@@ -0,0 +1,78 @@
+import mmap
+import numpy as np
+import metrics
+from game import MOVES
+
+# Binary Q-table file, opened with mmap and searched in place:
+#   header  16 bytes: magic b'QXQT', version (uint32), number of entries n (uint64)
+#   keys    n uint64, sorted: (packed board << 8) | move id
+#   values  n float32, values[i] is the Q-value of keys[i]
+# The board is packed with 2 bits per cell (0 neutral, 1 player 0, 2 player 1), 50 bits in total, so all the
+# actions of a state are contiguous. Every process opening the file shares the same pages of the OS cache.
+
+MAGIC = b'QXQT'
+VERSION = 1
+HEADER = np.dtype([('magic', 'S4'), ('version', '<u4'), ('count', '<u8')])
+_CELL_SHIFTS = 2 * np.arange(25, dtype=np.uint64)
+
+
+def pack_board(board: np.ndarray) -> int:
+    '''Packs a 5x5 board (-1 neutral, 0/1 players) into an integer of 50 bits, 2 bits per cell'''
+    codes = (np.asarray(board).flatten() + 1).astype(np.uint64)
+    return int(np.bitwise_or.reduce(codes << _CELL_SHIFTS))
+
+
+def unpack_board(state: int) -> np.ndarray:
+    '''Inverse of pack_board'''
+    codes = (np.uint64(state) >> _CELL_SHIFTS) & np.uint64(3)
+    return (codes.astype(np.int16) - 1).reshape((5, 5))
+
+
+def write_q_table(filename: str, states, actions, values) -> None:
+    '''Writes the entries (packed state, move id, value) given as three parallel sequences'''
+    keys = (np.asarray(states, dtype=np.uint64) << np.uint64(8)) | np.asarray(actions, dtype=np.uint64)
+    order = np.argsort(keys)
+    header = np.array([(MAGIC, VERSION, len(keys))], dtype=HEADER)
+    with open(filename, 'wb') as file:
+        file.write(header.tobytes())
+        file.write(keys[order].astype('<u8').tobytes())
+        file.write(np.asarray(values, dtype='<f4')[order].tobytes())
+
+
+class QTableFile(object):
+    '''Read-only Q-table mapped in memory. Missing entries read as `default` and are never inserted'''
+
+    def __init__(self, filename: str, default: float = 0.0) -> None:
+        self.default = default
+        with open(filename, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mmap, dtype=HEADER, count=1)[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise ValueError(f'{filename} is not a Q-table file of version {VERSION}')
+        count = int(header['count'])
+        self.keys = np.frombuffer(self._mmap, dtype='<u8', count=count, offset=HEADER.itemsize)
+        self.values = np.frombuffer(self._mmap, dtype='<f4', count=count, offset=HEADER.itemsize + 8 * count)
+        metrics.gauge('qtable.size', count)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get(self, state: int, action: int) -> float:
+        '''Q-value of the action (move id) in the state (packed board)'''
+        key = np.uint64(state << 8 | action)
+        idx = np.searchsorted(self.keys, key)
+        metrics.count('qtable.lookups')
+        if idx < len(self.keys) and self.keys[idx] == key:
+            metrics.count('qtable.hits')
+            return float(self.values[idx])
+        return self.default
+
+    def row(self, state: int) -> np.ndarray:
+        '''Q-values of all the move ids in the state, found with two binary searches'''
+        low, high = np.searchsorted(self.keys, [np.uint64(state << 8), np.uint64((state + 1) << 8)])
+        metrics.count('qtable.lookups')
+        if high > low:
+            metrics.count('qtable.hits')
+        row = np.full(len(MOVES), self.default, dtype=np.float32)
+        row[(self.keys[low:high] & np.uint64(0xFF)).astype(np.int64)] = self.values[low:high]
+        return row
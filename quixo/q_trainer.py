@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+from multiprocessing import Process, Queue, Value
+from queue import Empty
+import numpy as np
+from tqdm import tqdm
+import metrics
+from bitboard_game import BitboardGame
+from symmetry import canonicalize, swap_players, MOVE_MAPS
+from q_table_file import QTableFile, pack_board
+from q_store import QStore, best_action
+from q_learning import QLearning
+
+# Parallel trainer of the Q-table. Worker processes play the episodes, each with its own seed and epsilon schedule,
+# choosing the moves with the last snapshot of the table they have seen. They encode the trajectories (packed
+# canonical board and move id, as QLearning.encode) and send them in batches to the learner, the main process,
+# which applies them to its QStore and periodically publishes a new snapshot file that the workers map in memory.
+# A checkpoint is the table plus a JSON file with the episodes played by every worker, from which a run is resumed.
+
+
+def epsilon(episode: int, worker: int, workers: int, start: float = 1.0, decay: float = 0.9999,
+            min_eps: float = 0.15) -> float:
+    '''
+    Exploration rate of the worker at its episode-th episode: decays from start by `decay` per episode down to a
+    minimum that goes from min_eps / 2 (first worker) to 2 * min_eps (last worker), so the workers explore differently
+    '''
+    spread = 2.0 ** (2 * worker / (workers - 1) - 1) if workers > 1 else 1.0
+    return max(min_eps * spread, start * decay ** episode)
+
+
+def play_episode(table, rng: np.random.Generator, eps: float, opponent: str, max_moves: int) -> list[tuple]:
+    '''
+    Plays one game, player 0 first. The learner is player 1 and, with opponent='self', also player 0, which sees the
+    board with the pieces swapped; with opponent='random' player 0 plays at random. Returns the encoded trajectory
+    (states, move ids, reward) of every learning side
+    '''
+    game = BitboardGame()
+    learners = (0, 1) if opponent == 'self' else (1,)
+    trajectories = {player: ([], []) for player in learners}
+    player = 0
+    winner = -1
+    for _ in range(max_moves):
+        move_ids = list(game.iter_move_ids(player))
+        if player in learners:
+            board = game.get_board() if player == 1 else swap_players(game.get_board())
+            board, symmetry = canonicalize(board)
+            state = pack_board(board)
+            action_ids = MOVE_MAPS[symmetry, move_ids]
+            if table is None or rng.uniform() < eps:
+                idx = int(rng.integers(len(move_ids)))
+            else:
+                idx = best_action(table.row(state), action_ids, rng)
+            trajectories[player][0].append(state)
+            trajectories[player][1].append(int(action_ids[idx]))
+        else:
+            idx = int(rng.integers(len(move_ids)))
+        game.push(move_ids[idx], player)
+        winner = game.check_winner()
+        if winner != -1:
+            break
+        player = 1 - player
+    # same rewards as QLearning.calculate_reward: 1 for a win, -1 for a loss, 0 for a draw (too long a game)
+    return [(states, actions, 0 if winner == -1 else (1 if winner == player else -1))
+            for player, (states, actions) in trajectories.items()]
+
+
+def _pack_episodes(episodes: list[tuple]) -> tuple:
+    # the trajectories of a batch as flat arrays, cheaper to send than lists of tuples
+    states = np.array([state for trajectory in episodes for state in trajectory[0]], dtype=np.int64)
+    actions = np.array([action for trajectory in episodes for action in trajectory[1]], dtype=np.int8)
+    lengths = np.array([len(trajectory[0]) for trajectory in episodes], dtype=np.int32)
+    rewards = np.array([trajectory[2] for trajectory in episodes], dtype=np.int8)
+    return states, actions, lengths, rewards
+
+
+def _unpack_episodes(states, actions, lengths, rewards) -> list[tuple]:
+    ends = np.cumsum(lengths)
+    return [(states[end - length:end], actions[end - length:end], int(reward))
+            for end, length, reward in zip(ends, lengths, rewards)]
+
+
+def _worker(worker: int, workers: int, seed: int, first_episode: int, last_episode: int, schedule: dict,
+            opponent: str, max_moves: int, batch_episodes: int, snapshot: str, version, queue: Queue) -> None:
+    # plays the episodes [first_episode, last_episode) of the worker and sends them to the learner
+    rng = np.random.default_rng(np.random.SeedSequence([seed, worker, first_episode]))
+    table, seen = None, 0
+    batch = []
+    for episode in range(first_episode, last_episode):
+        if version.value != seen:  # a new snapshot has been published
+            seen = version.value
+            table = QTableFile(snapshot)
+        batch.append(play_episode(table, rng, epsilon(episode, worker, workers, **schedule), opponent, max_moves))
+        if len(batch) == batch_episodes or episode == last_episode - 1:
+            queue.put((worker, len(batch), _pack_episodes([trajectory for game in batch for trajectory in game])))
+            batch = []
+    queue.put((worker, 0, None))
+
+
+class Trainer(object):
+    '''
+    Multi-process Q-learning. `episodes` is the total number of games, split among `workers` processes.
+    A snapshot of the table is published every `snapshot_every` learned episodes, a checkpoint (if `checkpoint`,
+    a path without extension, is given) is written every `checkpoint_every` and at the end.
+    '''
+
+    def __init__(self, episodes: int, workers: int = None, seed: int = 0, alpha: float = 0.5, gamma: float = 0.85,
+                 schedule: dict = None, opponent: str = 'random', max_moves: int = 1000, batch_episodes: int = 256,
+                 snapshot: str = 'Q_table_snapshot.bin', snapshot_every: int = 20000, checkpoint: str = None,
+                 checkpoint_every: int = 1000000, metrics_file: str = None, poll_timeout: float = 10.0) -> None:
+        if opponent not in ('random', 'self'):
+            raise ValueError(f"unknown opponent {opponent!r}, use 'random' or 'self'")
+        self.episodes = episodes
+        self.workers = workers or os.cpu_count()
+        self.seed = seed
+        self.schedule = schedule or {}
+        self.opponent = opponent
+        self.max_moves = max_moves
+        self.batch_episodes = batch_episodes
+        self.snapshot = snapshot
+        self.snapshot_every = snapshot_every
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.metrics_file = metrics_file  # the metrics of the learner are appended to it at every snapshot
+        self.poll_timeout = poll_timeout  # seconds without batches after which the workers are checked
+        self.agent = QLearning(alpha, gamma, 0, 1)
+        self.worker_episodes = [0] * self.workers  # episodes of every worker already learned
+        self.version = Value('i', 0)
+
+    def resume(self) -> bool:
+        '''Loads the checkpoint, if there is one. Returns whether it was found'''
+        if self.checkpoint is None or not os.path.exists(self.checkpoint + '.json'):
+            return False
+        with open(self.checkpoint + '.json') as file:
+            state = json.load(file)
+        if state['workers'] != self.workers or state['seed'] != self.seed:
+            raise ValueError(f"{self.checkpoint} was written by a run with {state['workers']} workers and "
+                             f"seed {state['seed']}")
+        self.agent.q_table = QStore.load(self.checkpoint + '.bin')
+        self.worker_episodes = state['worker_episodes']
+        return True
+
+    def save_checkpoint(self) -> None:
+        # the table first: after a crash in between, the episodes since the previous checkpoint are replayed, never lost
+        self.agent.save_q_table(self.checkpoint + '.bin.tmp')
+        os.replace(self.checkpoint + '.bin.tmp', self.checkpoint + '.bin')
+        with open(self.checkpoint + '.json.tmp', 'w') as file:
+            json.dump({'workers': self.workers, 'seed': self.seed, 'worker_episodes': self.worker_episodes}, file)
+        os.replace(self.checkpoint + '.json.tmp', self.checkpoint + '.json')
+
+    def publish(self) -> None:
+        # written aside and renamed, so the workers never map a file being written
+        self.agent.save_q_table(self.snapshot + '.tmp')
+        os.replace(self.snapshot + '.tmp', self.snapshot)
+        self.version.value += 1
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'a') as file:
+                metrics.REGISTRY.dump(file, snapshot=self.version.value, episodes=sum(self.worker_episodes))
+
+    def quota(self, worker: int) -> int:
+        return self.episodes // self.workers + (worker < self.episodes % self.workers)
+
+    def run(self) -> QStore:
+        '''Trains until every worker has played its share of the episodes and returns the table'''
+        if len(self.agent.q_table):  # resumed: the workers start from the checkpoint table
+            self.publish()
+        queue = Queue(maxsize=4 * self.workers)
+        processes = {worker: Process(target=_worker, args=(
+            worker, self.workers, self.seed, self.worker_episodes[worker], self.quota(worker), self.schedule,
+            self.opponent, self.max_moves, self.batch_episodes, self.snapshot, self.version, queue), daemon=True)
+            for worker in range(self.workers) if self.worker_episodes[worker] < self.quota(worker)}
+        for process in processes.values():
+            process.start()
+        learned = sum(self.worker_episodes)
+        last_snapshot, last_checkpoint = learned, learned
+        running = set(processes)  # workers that have not sent their end message yet
+        with tqdm(total=self.episodes, initial=learned) as progress:
+            while running:
+                try:
+                    worker, count, batch = queue.get(timeout=self.poll_timeout)
+                except Empty:
+                    self.check_workers(processes, running)
+                    continue
+                if batch is None:
+                    running.discard(worker)
+                    continue
+                with metrics.timer('trainer.update_batch'):
+                    self.agent.update_batch(_unpack_episodes(*batch))
+                metrics.count('trainer.episodes', count)
+                metrics.count('trainer.steps', len(batch[0]))
+                self.worker_episodes[worker] += count
+                learned += count
+                progress.update(count)
+                if learned - last_snapshot >= self.snapshot_every:
+                    self.publish()
+                    last_snapshot = learned
+                if self.checkpoint is not None and learned - last_checkpoint >= self.checkpoint_every:
+                    self.save_checkpoint()
+                    last_checkpoint = learned
+        for process in processes.values():
+            process.join()
+        if self.checkpoint is not None:
+            self.save_checkpoint()
+        return self.agent.q_table
+
+    def check_workers(self, processes: dict, running: set) -> None:
+        # a worker that has exited without its end message died (exception, killed by the OOM killer...): the run
+        # is aborted instead of waiting forever, after a checkpoint of the episodes learned, from which it resumes
+        # (exit code 0: the worker has finished, its end message is still on the way)
+        dead = [worker for worker in running if not processes[worker].is_alive() and processes[worker].exitcode != 0]
+        if not dead:
+            return
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        if self.checkpoint is not None:
+            self.save_checkpoint()
+        codes = ', '.join(f'worker {worker} exit code {processes[worker].exitcode}' for worker in sorted(dead))
+        resume = f', resume from {self.checkpoint}' if self.checkpoint is not None else ''
+        raise RuntimeError(f'training aborted, {codes}{resume}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parallel Q-learning trainer for QLearningPlayer')
+    parser.add_argument('--episodes', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--opponent', choices=['random', 'self'], default='random')
+    parser.add_argument('--checkpoint', default=None, help='path (without extension) of the checkpoint, resumed if present')
+    parser.add_argument('--checkpoint-every', type=int, default=1000000)
+    parser.add_argument('--snapshot-every', type=int, default=20000)
+    parser.add_argument('--output', default='Q_table_1.bin')
+    parser.add_argument('--metrics', default=None, help='file where the metrics are appended as JSON lines at every snapshot')
+    args = parser.parse_args()
+
+    trainer = Trainer(args.episodes, args.workers, args.seed, opponent=args.opponent, checkpoint=args.checkpoint,
+                      checkpoint_every=args.checkpoint_every, snapshot_every=args.snapshot_every, metrics_file=args.metrics)
+    if trainer.resume():
+        print(f'resumed from {args.checkpoint} after {sum(trainer.worker_episodes)} episodes')
+    trainer.run()
+    trainer.agent.save_q_table(args.output)
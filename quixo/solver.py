@@ -0,0 +1,231 @@
+import sqlite3
+import numpy as np
+from game import Game, Move, MOVES
+from bitboard_game import BitboardGame
+from symmetry import canonicalize, swap_players, MOVE_MAPS, INVERSE_MOVE_MAPS
+from q_table_file import pack_board
+
+# Proof search for the end of the game. A position is solved when the player to move can force a win within
+# `depth` plies (WIN), or loses within `depth` plies whatever it plays (LOSS). Quixo has no end of the material,
+# so the proofs are bounded by depth: UNKNOWN means no forced result was found within that depth.
+# The results are kept in a SQLite database, keyed by the canonical board seen from the player to move
+# (see symmetry.py), so the same position is solved only once, also across games and processes.
+
+WIN = 1
+LOSS = -1
+UNKNOWN = 0
+
+
+class SolverBudget(Exception):
+    '''Raised inside the search when the solver has visited max_nodes positions'''
+    pass
+
+
+class SolutionDB(object):
+    '''
+    Results of the solver: canonical board -> (result, depth, best move). The entries read are cached in memory.
+    A proven result keeps the smallest depth found, an UNKNOWN one the largest depth searched.
+    '''
+
+    def __init__(self, path: str = ':memory:') -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS solutions ('
+                                'board INTEGER PRIMARY KEY, result INTEGER NOT NULL, '
+                                'depth INTEGER NOT NULL, move INTEGER NOT NULL)')
+        self.cache = {}
+
+    @staticmethod
+    def key(board: np.ndarray, player_idx: int) -> tuple[int, int]:
+        # the board seen by the player to move as player 0, canonicalized: (packed board, symmetry)
+        board = board if player_idx == 0 else swap_players(board)
+        board, symmetry = canonicalize(board)
+        return pack_board(board), symmetry
+
+    def _read(self, key: int):
+        if key not in self.cache:
+            self.cache[key] = self.connection.execute(
+                'SELECT result, depth, move FROM solutions WHERE board = ?', (key,)).fetchone()
+        return self.cache[key]
+
+    def get(self, game) -> tuple:
+        '''(result, depth, move id) of the position for its player to move, None if it was never solved'''
+        key, symmetry = self.key(game.get_board(), game.get_current_player())
+        entry = self._read(key)
+        if entry is None:
+            return None
+        result, depth, move = entry
+        return result, depth, int(INVERSE_MOVE_MAPS[symmetry, move]) if move >= 0 else -1
+
+    def put(self, game, result: int, depth: int, move: int = -1) -> None:
+        key, symmetry = self.key(game.get_board(), game.get_current_player())
+        entry = self._read(key)
+        if entry is not None:
+            if entry[0] != UNKNOWN and (result == UNKNOWN or entry[1] <= depth):
+                return
+            if entry[0] == UNKNOWN and result == UNKNOWN and entry[1] >= depth:
+                return
+        entry = (result, depth, int(MOVE_MAPS[symmetry, move]) if move >= 0 else -1)
+        self.connection.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)', (key, *entry))
+        self.cache[key] = entry
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+
+class Solver(object):
+    '''
+    Proves forced wins and losses of the player to move within max_depth plies, by iterative deepening on the
+    AND/OR tree of the game: a win needs one move after which every answer of the opponent still loses, a loss
+    needs every move to leave the opponent a win. The moves are classified in one pass (classify_moves), so a
+    win in 1 never needs a recursion. Subresults are kept in memory by position and depth; the root results,
+    and the wins proven at depth 3 or more under it, go to the database.
+    '''
+
+    def __init__(self, db: SolutionDB = None, max_depth: int = 3, max_nodes: int = 200000) -> None:
+        self.db = db if db is not None else SolutionDB()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.wins = {}  # position key -> (smallest depth of a proven win, winning move)
+        self.no_wins = {}  # position key -> largest depth without a forced win
+        self.losses = {}  # position key -> smallest depth of a proven loss
+        self.no_losses = {}  # position key -> largest depth without a forced loss
+
+    def solve(self, game: 'Game', max_depth: int = None) -> tuple[int, int, tuple[tuple[int, int], Move]]:
+        '''
+        (result, depth, move) for the player to move: the best move is given for the WIN results.
+        The database is checked first, and updated with the result.
+        '''
+        max_depth = self.max_depth if max_depth is None else max_depth
+        entry = self.db.get(game)
+        if entry is not None and (entry[0] != UNKNOWN or entry[1] >= max_depth):
+            return entry[0], entry[1], MOVES[entry[2]] if entry[2] >= 0 else None
+        sim = BitboardGame.from_board(game.get_board(), game.get_current_player())
+        if len(self.wins) + len(self.no_wins) + len(self.losses) + len(self.no_losses) > 4000000:
+            self.clear()
+        self.nodes = 0
+        result, depth, move = UNKNOWN, 0, -1
+        try:
+            for depth in range(1, max_depth + 1):
+                # a win ends with a move of the player to move, so it takes an odd number of plies, a loss an even one
+                if depth % 2 == 1:
+                    move = self.win_within(sim, depth)
+                    if move >= 0:
+                        result = WIN
+                        break
+                elif self.loses_within(sim, depth):
+                    result = LOSS
+                    break
+            else:
+                depth = max_depth
+        except SolverBudget:
+            return UNKNOWN, depth - 1, None
+        self.db.put(game, result, depth, move)
+        self.store_proofs(sim)
+        self.db.commit()
+        return result, depth, MOVES[move] if move >= 0 else None
+
+    def store_proofs(self, sim: BitboardGame) -> None:
+        # the wins proven deep enough under the root, for the positions one and two plies ahead
+        for move_id in list(sim.iter_move_ids(sim.current_player_idx)):
+            sim.push(move_id)
+            for answer in list(sim.iter_move_ids(sim.current_player_idx)):
+                sim.push(answer)
+                proof = self.wins.get(sim.zobrist_key())
+                if proof is not None and proof[0] >= 3:
+                    self.db.put(sim, WIN, proof[0], proof[1])
+                sim.pop()
+            sim.pop()
+
+    def clear(self) -> None:
+        '''Forgets the subresults kept in memory (the database is not touched)'''
+        self.wins, self.no_wins, self.losses, self.no_losses = {}, {}, {}, {}
+
+    def _visit(self) -> None:
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SolverBudget()
+
+    def win_within(self, sim: BitboardGame, depth: int) -> int:
+        '''Move id forcing a win of the player to move within depth plies, -1 if there is none'''
+        key = sim.zobrist_key()
+        proof = self.wins.get(key)
+        if proof is not None and proof[0] <= depth:
+            return proof[1]
+        if self.no_wins.get(key, 0) >= depth:
+            return -1
+        self._visit()
+        classes = sim.classify_moves(sim.current_player_idx)
+        if classes.winning:
+            self.wins[key] = (1, classes.winning[0])
+            return classes.winning[0]
+        if depth >= 3:
+            # the moves taking a neutral cube first: they add a piece to the lines of the player
+            for move_id in classes.claims + [move_id for move_id in classes.neutral if move_id not in classes.claims]:
+                sim.push(move_id)
+                try:
+                    lost = self.loses_within(sim, depth - 1)
+                finally:
+                    sim.pop()
+                if lost:
+                    self.wins[key] = (depth, move_id)
+                    return move_id
+        self.no_wins[key] = depth
+        return -1
+
+    def loses_within(self, sim: BitboardGame, depth: int) -> bool:
+        '''Whether every move of the player to move lets the opponent win within depth - 1 plies'''
+        key = sim.zobrist_key()
+        if self.losses.get(key, depth + 1) <= depth:
+            return True
+        if self.no_losses.get(key, 0) >= depth:
+            return False
+        self._visit()
+        classes = sim.classify_moves(sim.current_player_idx)
+        # the losing moves give the win to the opponent at once, the other ones must all be refuted
+        lost = not classes.winning and depth >= 2 and bool(classes.neutral or classes.losing)
+        if lost:
+            for move_id in classes.neutral:
+                sim.push(move_id)
+                try:
+                    refuted = self.win_within(sim, depth - 1) >= 0
+                finally:
+                    sim.pop()
+                if not refuted:
+                    lost = False
+                    break
+        if lost:
+            self.losses[key] = depth
+        else:
+            self.no_losses[key] = depth
+        return lost
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    parser = argparse.ArgumentParser(description='Fills the solution database with the positions of random games')
+    parser.add_argument('--db', default='solutions.db')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    solver = Solver(SolutionDB(args.db), args.depth)
+    counts = {WIN: 0, LOSS: 0, UNKNOWN: 0}
+    for _ in range(args.games):
+        game = BitboardGame()
+        game.current_player_idx = 0
+        while game.check_winner() == -1:
+            counts[solver.solve(game)[0]] += 1
+            game.push(random.choice(list(game.iter_move_ids(game.current_player_idx))))
+    solver.db.close()
+    print(f'{counts[WIN]} wins, {counts[LOSS]} losses, {counts[UNKNOWN]} unknown')
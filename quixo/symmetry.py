@@ -0,0 +1,87 @@
+import numpy as np
+from game import Move, MOVES, MOVE_IDS
+
+# The 8 symmetries of the square board (rotations and reflections) leave the rules of Quixo unchanged, so the
+# 8 images of a position are the same position. Every board is mapped to one representative of its 8 images,
+# the canonical board, and the moves are mapped with the same symmetry, so the Q-table stores each of them once.
+
+# symmetry t maps the cell (x, y) to TRANSFORMS[t](x, y)
+TRANSFORMS = [
+    lambda x, y: (x, y),  # identity
+    lambda x, y: (4 - y, x),  # rotation by 90 degrees
+    lambda x, y: (4 - x, 4 - y),  # rotation by 180 degrees
+    lambda x, y: (y, 4 - x),  # rotation by 270 degrees
+    lambda x, y: (4 - x, y),  # horizontal reflection
+    lambda x, y: (x, 4 - y),  # vertical reflection
+    lambda x, y: (y, x),  # reflection on the principal diagonal
+    lambda x, y: (4 - y, 4 - x),  # reflection on the secondary diagonal
+]
+
+
+def _destination(from_pos: tuple[int, int], slide: Move) -> tuple[int, int]:
+    # cell where the taken piece ends up: the border in the direction of the slide
+    x, y = from_pos
+    if slide == Move.TOP:
+        return x, 0
+    if slide == Move.BOTTOM:
+        return x, 4
+    if slide == Move.LEFT:
+        return 0, y
+    return 4, y
+
+
+def _build_tables() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # PERMUTATIONS[t]: the flat board transformed by t is board.flatten()[PERMUTATIONS[t]]
+    # MOVE_MAPS[t][m]: id of the image of move m under t, INVERSE_MOVE_MAPS[t] undoes it.
+    # A move is identified by the cell it takes and the cell where the piece ends up, so its image is the move
+    # taking the image of the first cell and ending on the image of the second one.
+    by_cells = {}
+    for move_id, (from_pos, slide) in enumerate(MOVES):
+        by_cells[(from_pos, _destination(from_pos, slide))] = move_id
+    permutations = np.zeros((len(TRANSFORMS), 25), dtype=np.int64)
+    move_maps = np.zeros((len(TRANSFORMS), len(MOVES)), dtype=np.int64)
+    for t, transform in enumerate(TRANSFORMS):
+        for y in range(5):
+            for x in range(5):
+                tx, ty = transform(x, y)
+                permutations[t, ty * 5 + tx] = y * 5 + x
+        for move_id, (from_pos, slide) in enumerate(MOVES):
+            move_maps[t, move_id] = by_cells[(transform(*from_pos), transform(*_destination(from_pos, slide)))]
+    return permutations, move_maps, np.argsort(move_maps, axis=1)
+
+
+PERMUTATIONS, MOVE_MAPS, INVERSE_MOVE_MAPS = _build_tables()
+_POWERS = 3 ** np.arange(25, dtype=np.int64)
+
+
+def canonicalize(board: np.ndarray) -> tuple[np.ndarray, int]:
+    '''
+    Returns the canonical image of the 5x5 board and the index of the symmetry that produces it.
+    The canonical image is the one with the smallest base-3 value of its cells.
+    '''
+    images = np.asarray(board).flatten()[PERMUTATIONS]
+    t = int(np.argmin((images + 1) @ _POWERS))
+    return images[t].reshape((5, 5)), t
+
+
+def canonicalize_boards(boards: np.ndarray) -> np.ndarray:
+    '''(N, 25) canonical images of a batch of boards ((N, 5, 5) or (N, 25)), as canonicalize does for one board'''
+    images = np.asarray(boards).reshape(len(boards), 25)[:, PERMUTATIONS]
+    t = np.argmin((images.astype(np.int64) + 1) @ _POWERS, axis=1)
+    return images[np.arange(len(images)), t]
+
+
+def transform_move(move: tuple[tuple[int, int], Move], t: int) -> tuple[tuple[int, int], Move]:
+    '''Image of the move (position, slide) under the symmetry t, i.e. the same move on the canonical board'''
+    return MOVES[MOVE_MAPS[t, MOVE_IDS[(tuple(move[0]), move[1])]]]
+
+
+def untransform_move(move: tuple[tuple[int, int], Move], t: int) -> tuple[tuple[int, int], Move]:
+    '''Move on the original board corresponding to a move on the board transformed by t'''
+    return MOVES[INVERSE_MOVE_MAPS[t, MOVE_IDS[(tuple(move[0]), move[1])]]]
+
+
+def swap_players(board: np.ndarray) -> np.ndarray:
+    '''The board with the pieces of the two players exchanged: a position of player 0 seen as one of player 1'''
+    board = np.asarray(board)
+    return np.where(board >= 0, 1 - board, board).astype(board.dtype)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules of quixo are imported by name, as the scripts do when they are run from the quixo directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,145 @@
+import random
+import numpy as np
+import pytest
+import batch_rollout
+from bitboard_game import BitboardGame
+from game import Game, MOVES
+
+# The engines must agree move by move: the NumPy Game is the reference, BitboardGame and the vectorized functions of
+# batch_rollout are checked against it on seeded random games.
+
+SEEDS = range(20)
+
+
+def random_game(seed: int, max_moves: int = 60) -> list[int]:
+    '''Move ids of a seeded random game, player 0 first, until a win or max_moves'''
+    rng = random.Random(seed)
+    game = Game()
+    moves = []
+    for ply in range(max_moves):
+        move_id = rng.choice(list(game.iter_move_ids(ply % 2)))
+        game.push(move_id, ply % 2)
+        moves.append(move_id)
+        if game.check_winner() != -1:
+            break
+    return moves
+
+
+def positions(seeds=SEEDS) -> list[tuple[np.ndarray, int]]:
+    '''(board, player to move) of every position of the random games'''
+    result = []
+    for seed in seeds:
+        game = Game()
+        for ply, move_id in enumerate(random_game(seed)):
+            result.append((game.get_board(), ply % 2))
+            game.push(move_id, ply % 2)
+    return result
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_bitboard_follows_game(seed):
+    game, bitboard = Game(), BitboardGame()
+    for ply, move_id in enumerate(random_game(seed)):
+        player = ply % 2
+        assert list(game.iter_move_ids(player)) == list(bitboard.iter_move_ids(player))
+        assert game.available_moves(player) == bitboard.available_moves(player)
+        assert game.push(move_id, player) and bitboard.push(move_id, player)
+        assert (game.get_board() == bitboard.get_board()).all()
+        assert game.check_winner() == bitboard.check_winner()
+        assert (game.line_counts() == bitboard.line_counts()).all()
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_batch_rollout_follows_game(seed):
+    game = Game()
+    for ply, move_id in enumerate(random_game(seed)):
+        player = ply % 2
+        board = game.get_board().reshape(1, 25).astype(np.int8)
+        mask = batch_rollout.legal_mask(board, np.array([player]))[0]
+        assert np.flatnonzero(mask).tolist() == list(game.iter_move_ids(player))
+        after = batch_rollout.apply_moves(board, np.array([move_id]), np.array([player], dtype=np.int8))
+        game.push(move_id, player)
+        assert (after[0] == game.get_board().flatten()).all()
+        assert batch_rollout.winners(after)[0] == game.check_winner()
+
+
+def test_winners_on_arbitrary_boards():
+    # boards with any number of complete lines, also of both players: the first line in order gives the winner
+    rng = np.random.default_rng(0)
+    boards = rng.choice([-1, 0, 1], size=(2000, 25), p=[0.1, 0.45, 0.45]).astype(np.int8)
+    results = batch_rollout.winners(boards)
+    for board, result in zip(boards, results):
+        assert Game.from_board(board.reshape(5, 5)).check_winner() == result
+        assert BitboardGame.from_board(board.reshape(5, 5)).check_winner() == result
+
+
+@pytest.mark.parametrize('engine', [Game, BitboardGame])
+def test_push_pop_round_trip(engine):
+    # every legal move of the positions: after push the incremental state is the one of a game rebuilt from the
+    # board, after pop it is the one before the move
+    for board, player in positions(range(5)):
+        game = engine.from_board(board, player)
+        key, counts = game.zobrist_key(), game.line_counts()
+        for move_id in list(game.iter_move_ids(player)):
+            assert game.push(move_id)
+            rebuilt = engine.from_board(game.get_board(), 1 - player)
+            assert game.current_player_idx == 1 - player
+            assert game.zobrist_key() == rebuilt.zobrist_key()
+            assert (game.line_counts() == rebuilt.line_counts()).all()
+            assert game.check_winner() == rebuilt.check_winner()
+            game.pop()
+            assert (game.get_board() == board).all()
+            assert game.current_player_idx == player
+            assert game.zobrist_key() == key
+            assert (game.line_counts() == counts).all()
+
+
+def brute_force_classes(board: np.ndarray, player: int) -> tuple[list, list, list, list]:
+    # winning, losing, neutral moves and neutral moves taking a neutral cube, by applying every move
+    game = Game.from_board(board, player)
+    winning, losing, neutral, claims = [], [], [], []
+    for move_id in list(game.iter_move_ids(player)):
+        (x, y), _ = MOVES[move_id]
+        game.push(move_id)
+        winner = game.check_winner()
+        game.pop()
+        if winner == player:
+            winning.append(move_id)
+        elif winner >= 0:
+            losing.append(move_id)
+        else:
+            neutral.append(move_id)
+            if board[y, x] < 0:
+                claims.append(move_id)
+    return winning, losing, neutral, claims
+
+
+def classify_boards() -> list[tuple[np.ndarray, int]]:
+    # positions of random games, and random boards with many pieces, often with complete lines already
+    rng = np.random.default_rng(1)
+    boards = rng.choice([-1, 0, 1], size=(500, 5, 5), p=[0.2, 0.4, 0.4])
+    return positions(range(10)) + [(board, idx % 2) for idx, board in enumerate(boards)]
+
+
+@pytest.mark.parametrize('engine', [Game, BitboardGame])
+def test_classify_moves_matches_brute_force(engine):
+    for board, player in classify_boards():
+        classes = engine.from_board(board, player).classify_moves(player)
+        assert tuple(classes) == brute_force_classes(board, player)
+
+
+@pytest.mark.parametrize('engine', [Game, BitboardGame])
+def test_clever_available_moves(engine):
+    # the first winning move alone, otherwise the neutral moves taking a neutral cube (read at (row y, column x) of
+    # the board), otherwise the neutral moves, otherwise one legal move
+    for board, player in classify_boards():
+        winning, _, neutral, claims = brute_force_classes(board, player)
+        moves = engine.from_board(board, player).clever_available_moves(player)
+        if winning:
+            assert moves == [MOVES[winning[0]]]
+        elif claims:
+            assert moves == [MOVES[move_id] for move_id in claims]
+        elif neutral:
+            assert moves == [MOVES[move_id] for move_id in neutral]
+        else:
+            assert len(moves) == 1 and moves[0] in engine.from_board(board, player).available_moves(player)
@@ -0,0 +1,179 @@
+import argparse
+import os
+import random
+import time
+from itertools import combinations
+from multiprocessing import Pool
+import numpy as np
+import metrics
+from game import Game
+from bitboard_game import BitboardGame
+from random_player import RandomPlayer
+from clever_player import CleverPlayer
+from minmax_player import MinMaxPlayer
+from monte_carlo_player import MonteCarloPlayer
+from experiment_player import ExperimentPlayer
+from mcts_player import MCTSPlayer
+
+# Tournament runner: the games are spread over a pool of processes. Every game gets its own seed,
+# derived only from the tournament seed and the index of the game, so the results are the same
+# whatever the number of workers and the order in which they finish. For that the players that search have a fixed
+# effort (depth, playouts) instead of a time budget, which would make their moves depend on the load of the machine.
+
+
+def _qlearning_player(player_idx: int):
+    # imported here: the player loads its Q-table when it is created
+    from qlearning_player import QLearningPlayer
+    return QLearningPlayer()
+
+
+# name -> factory taking the index (0 or 1) the player has in the game
+PLAYERS = {
+    'random': lambda player_idx: RandomPlayer(),
+    'clever': lambda player_idx: CleverPlayer(),
+    'minmax': lambda player_idx: MinMaxPlayer(player_idx, time_limit=None),
+    'montecarlo': lambda player_idx: MonteCarloPlayer(),
+    'experiment': lambda player_idx: ExperimentPlayer(),
+    'mcts': lambda player_idx: MCTSPlayer(time_budget=None, max_playouts=2000),  # about 1 s per move
+    'qlearning': _qlearning_player,
+}
+
+ENGINES = {'game': Game, 'bitboard': BitboardGame}
+
+
+def game_seed(seed: int, game_idx: int) -> int:
+    '''Seed of a single game of the tournament'''
+    return int(np.random.SeedSequence([seed, game_idx]).generate_state(1)[0])
+
+
+def play_game(task: tuple) -> dict:
+    '''
+    Plays one game. task is (game index, name of player 0, name of player 1, seed, engine, max moves, max illegal moves).
+    A game longer than max moves is a draw, a player proposing more than max illegal moves in a row loses.
+    '''
+    game_idx, name0, name1, seed, engine, max_moves, max_illegal = task
+    random.seed(seed)
+    np.random.seed(seed)
+    players = [PLAYERS[name0](0), PLAYERS[name1](1)]
+    game = ENGINES[engine]()
+    move_time = [0.0, 0.0]
+    move_count = [0, 0]
+    winner = -1
+    try:
+        while winner < 0 and sum(move_count) < max_moves:
+            game.current_player_idx += 1
+            game.current_player_idx %= 2
+            player_idx = game.current_player_idx
+            ok = False
+            illegal = 0
+            start = time.perf_counter()
+            while not ok and illegal <= max_illegal:
+                from_pos, slide = players[player_idx].make_move(game)
+                ok = game.qlearning_move(from_pos, slide, player_idx)
+                illegal += not ok
+            elapsed = time.perf_counter() - start
+            move_time[player_idx] += elapsed
+            metrics.observe(f'move.{type(players[player_idx]).__name__}', elapsed)
+            if not ok:
+                winner = 1 - player_idx
+                break
+            move_count[player_idx] += 1
+            winner = game.check_winner()
+    finally:
+        for player in players:
+            player.close()
+    return {
+        'game': game_idx,
+        'players': [name0, name1],
+        'winner': int(winner),
+        'moves': sum(move_count),
+        'move_time': move_time,
+        'move_count': move_count,
+    }
+
+
+def _play_game_in_worker(task: tuple) -> dict:
+    # the metrics of the game travel with its result and are merged in the registry of the main process
+    metrics.REGISTRY.reset()
+    result = play_game(task)
+    result['metrics'] = metrics.REGISTRY.state()
+    return result
+
+
+def schedule(names: list[str], games_per_pair: int, seed: int, engine: str = 'game',
+             max_moves: int = 1000, max_illegal: int = 10000) -> list[tuple]:
+    '''Round-robin between the players: every pair plays games_per_pair games, alternating who plays first'''
+    tasks = []
+    for name_a, name_b in combinations(names, 2):
+        for k in range(games_per_pair):
+            # player 0 always moves first
+            first, second = (name_a, name_b) if k % 2 == 0 else (name_b, name_a)
+            game_idx = len(tasks)
+            tasks.append((game_idx, first, second, game_seed(seed, game_idx), engine, max_moves, max_illegal))
+    return tasks
+
+
+def run(tasks: list[tuple], workers: int = None) -> list[dict]:
+    '''
+    Plays all the games, in a pool of `workers` processes (all the cores by default). Results are sorted by game index.
+    The metrics of the games end up in the registry of this process
+    '''
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        results = [play_game(task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            results = list(pool.imap_unordered(_play_game_in_worker, tasks, chunksize=max(1, len(tasks) // (workers * 8))))
+        for result in results:
+            metrics.REGISTRY.merge(result.pop('metrics'))
+    return sorted(results, key=lambda r: r['game'])
+
+
+def summarize(results: list[dict]) -> dict:
+    '''Per player and opponent: wins, draws, losses, average moves per game and average time per move'''
+    stats = {}
+    for result in results:
+        for idx, name in enumerate(result['players']):
+            opponent = result['players'][1 - idx]
+            entry = stats.setdefault(name, {}).setdefault(opponent, {
+                'wins': 0, 'draws': 0, 'losses': 0, 'games': 0, 'moves': 0, 'move_time': 0.0, 'move_count': 0,
+            })
+            entry['games'] += 1
+            entry['moves'] += result['moves']
+            entry['move_time'] += result['move_time'][idx]
+            entry['move_count'] += result['move_count'][idx]
+            if result['winner'] == idx:
+                entry['wins'] += 1
+            elif result['winner'] == -1:
+                entry['draws'] += 1
+            else:
+                entry['losses'] += 1
+    for opponents in stats.values():
+        for entry in opponents.values():
+            entry['moves_per_game'] = entry.pop('moves') / entry['games']
+            entry['time_per_move'] = entry.pop('move_time') / max(1, entry.pop('move_count'))
+    return stats
+
+
+def print_summary(stats: dict) -> None:
+    for name, opponents in stats.items():
+        for opponent, entry in opponents.items():
+            print(f"{name} vs {opponent}: {entry['wins']}W {entry['draws']}D {entry['losses']}L "
+                  f"over {entry['games']} games, win rate {entry['wins'] / entry['games']:.1%}, "
+                  f"{entry['moves_per_game']:.1f} moves/game, {entry['time_per_move'] * 1000:.2f} ms/move")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Round-robin Quixo tournament')
+    parser.add_argument('players', nargs='+', choices=sorted(PLAYERS))
+    parser.add_argument('--games', type=int, default=1000, help='games for each pair of players')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='game')
+    parser.add_argument('--metrics', default=None, help='file where the metrics of the tournament are appended as JSON lines')
+    args = parser.parse_args()
+
+    print_summary(summarize(run(schedule(args.players, args.games, args.seed, args.engine), args.workers)))
+    if args.metrics:
+        with open(args.metrics, 'a') as file:
+            metrics.REGISTRY.dump(file, players=args.players, engine=args.engine)
@@ -0,0 +1,64 @@
+# Fixed-size transposition table for the alpha-beta search of MinMaxPlayer.
+# The entries are stored as parallel preallocated lists (one per field), the slot of a position is chosen by
+# Fibonacci hashing of its key, so both the Zobrist hashes of Game and the packed keys of BitboardGame spread well.
+
+EXACT = 0  # the value is the exact minmax value
+LOWER = 1  # the search failed high: the value is a lower bound
+UPPER = 2  # the search failed low: the value is an upper bound
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class TranspositionTable(object):
+    '''
+    2 ** size_bits entries of (key, depth, bound type, value, best move id). An entry is replaced when the slot is
+    empty, holds the same position, was written by an older search (see new_search) or was searched less deep.
+    '''
+
+    def __init__(self, size_bits: int = 20) -> None:
+        self.size_bits = size_bits
+        size = 1 << size_bits
+        self.keys = [-1] * size
+        self.depths = [0] * size
+        self.flags = [EXACT] * size
+        self.values = [0.0] * size
+        self.moves = [-1] * size
+        self.ages = [0] * size
+        self.age = 0
+        self.hits = 0
+        self.probes = 0
+
+    def _slot(self, key: int) -> int:
+        return ((key * _GOLDEN) & _MASK64) >> (64 - self.size_bits)
+
+    def new_search(self) -> None:
+        '''Marks the entries written so far as old, so that the next search can replace them'''
+        self.age += 1
+
+    def probe(self, key: int):
+        '''Returns (depth, bound type, value, best move id) stored for the position, None if it is not in the table'''
+        self.probes += 1
+        slot = self._slot(key)
+        if self.keys[slot] != key:
+            return None
+        self.hits += 1
+        return self.depths[slot], self.flags[slot], self.values[slot], self.moves[slot]
+
+    def store(self, key: int, depth: int, flag: int, value: float, move: int) -> None:
+        slot = self._slot(key)
+        if self.keys[slot] != -1 and self.keys[slot] != key and self.ages[slot] == self.age and self.depths[slot] > depth:
+            return
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.flags[slot] = flag
+        self.values[slot] = value
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+
+    def clear(self) -> None:
+        size = 1 << self.size_bits
+        self.keys = [-1] * size
+        self.age = 0
+        self.hits = 0
+        self.probes = 0